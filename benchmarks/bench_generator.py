@@ -0,0 +1,234 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the generator pipeline.
+
+Every phase is timed on its own (template render, skeleton copy, file
+writes, brief) and end to end, with the external tools mocked or real.
+Everything runs in temporary directories.
+
+    python benchmarks/bench_generator.py [-n PROJECTS] [-r REPEAT] [--real]
+    python benchmarks/bench_generator.py --save-baseline
+    python benchmarks/bench_generator.py --compare [--threshold 0.2]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import contextlib
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+import external
+import instrumentation
+from external import Bower, Virtualenv
+from materialize import Materializer
+from project.flask import FlaskProject, FlaskDbProject
+from template import generate_brief
+
+
+BASELINE_FILE = os.path.join(BENCH_DIR, 'baseline.json')
+PROJECT_CLASSES = (FlaskProject, FlaskDbProject)
+
+
+def mocked_run(delay):
+    def run(params, logfile, msg, exit_on_error=True, cwd=None, timeout=None, **kwargs):
+        time.sleep(delay)
+        if params[0] == Virtualenv.cmd():
+            # The steps after it expect the environment directory to exist
+            os.makedirs(Virtualenv.venv_bin_dir(params[-1]), exist_ok=True)
+        return True
+    return run
+
+
+@contextlib.contextmanager
+def workspace(real=False, delay=0.05):
+    """
+    Temporary working directory, virtualenv cache and, unless real is set,
+    external tools replaced by a command that only sleeps for delay seconds.
+    """
+    path = tempfile.mkdtemp(prefix='flask-skeleton-bench-')
+    cwd = os.getcwd()
+    saved = external.run, Virtualenv.cache_dir, Bower._util, Virtualenv._util
+    os.chdir(path)
+    Virtualenv.cache_dir = os.path.join(path, 'venvs')
+    if not real:
+        external.run = mocked_run(delay)
+        Bower._util = 'bower'
+        Virtualenv._util = 'virtualenv'
+    try:
+        yield path
+    finally:
+        external.run, Virtualenv.cache_dir, Bower._util, Virtualenv._util = saved
+        os.chdir(cwd)
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def timed(func, repeat):
+    timings = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        func(i)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def quiet(func):
+    def wrapped(*args, **kwargs):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            return func(*args, **kwargs)
+    return wrapped
+
+
+def make_projects(project_class, path, count, **kwargs):
+    return [project_class("app{}".format(i), apppath=path, **kwargs) for i in range(count)]
+
+
+def bench_render(project_class, count, repeat):
+    project = project_class("app")
+    templates = [project.config_file, project.readme_file, project.setup_file, project.npm_file]
+
+    def render(i):
+        for j in range(count):
+            for template_file in templates:
+                project.generate(template_file, project.config)
+    return timed(render, repeat)
+
+
+def bench_copytree(project_class, count, repeat):
+    with workspace() as path:
+        def copy(i):
+            for project in make_projects(project_class, os.path.join(path, str(i)), count):
+                Materializer(project.app_path).copy_tree(project.source_path)
+        return timed(copy, repeat)
+
+
+def bench_writes(project_class, count, repeat):
+    project = project_class("app")
+    content = project.generate(project.config_file, project.config)
+    with workspace() as path:
+        def write(i):
+            files = Materializer(os.path.join(path, str(i)))
+            for j in range(count):
+                for filename in ('config.py', 'README.md', 'setup.py', 'package.json', 'VERSION'):
+                    files.write(os.path.join(files.root, str(j), filename), content)
+        return timed(write, repeat)
+
+
+def bench_brief(project_class, count, repeat):
+    project = project_class("app", virtualenv=True, git=True)
+
+    def brief(i):
+        for j in range(count):
+            generate_brief(project.brief_var)
+    return timed(brief, repeat)
+
+
+def bench_install(project_class, count, repeat, real=False):
+    options = {'git': True, 'virtualenv': not real or bool(Virtualenv.cmd())}
+    if not real or Bower.cmd():
+        options['bower'] = ['jquery', 'bootstrap']
+    with workspace(real) as path:
+        @quiet
+        def install(i):
+            for project in make_projects(project_class, os.path.join(path, str(i)), count, **options):
+                project.install()
+        return timed(install, repeat)
+
+
+def phases(real):
+    yield 'render', bench_render
+    yield 'copytree', bench_copytree
+    yield 'writes', bench_writes
+    yield 'brief', bench_brief
+    yield 'install-mocked', bench_install
+    if real:
+        yield 'install-real', lambda *args: bench_install(*args, real=True)
+
+
+def run_benchmarks(count, repeat, real):
+    results = {}
+    for project_class in PROJECT_CLASSES:
+        for phase, bench in phases(real):
+            instrumentation.recorder.clear()
+            timings = bench(project_class, count, repeat)
+            results["{}.{}".format(project_class.__name__, phase)] = {
+                'count': count,
+                'repeat': repeat,
+                'min': min(timings),
+                'median': statistics.median(timings),
+                'mean': statistics.mean(timings),
+            }
+    return results
+
+
+def print_results(results, baseline=None):
+    width = max(len(name) for name in results)
+    print("{:<{width}}  {:>10}  {:>10}  {:>10}".format("Benchmark", "Min", "Median", "Baseline", width=width))
+    for name, result in sorted(results.items()):
+        reference = baseline.get(name, {}).get('median') if baseline else None
+        print("{:<{width}}  {:>9.2f}ms  {:>9.2f}ms  {:>10}".format(
+            name,
+            result['min'] * 1e3,
+            result['median'] * 1e3,
+            "{:.2f}ms".format(reference * 1e3) if reference else "-",
+            width=width
+        ))
+
+
+def regressions(results, baseline, threshold):
+    slower = []
+    for name, result in sorted(results.items()):
+        reference = baseline.get(name)
+        if reference is None or reference['count'] != result['count']:
+            continue
+        if result['median'] > reference['median'] * (1 + threshold):
+            slower.append((name, result['median'] / reference['median'] - 1))
+    return slower
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the project generator.')
+    parser.add_argument('-n', '--projects', type=int, default=10, help='Projects generated by every benchmark run')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='Runs of every benchmark')
+    parser.add_argument('--real', action='store_true', help='Also run the real external tools')
+    parser.add_argument('-o', '--output', help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='Baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline')
+    parser.add_argument('--compare', action='store_true', help='Fail when a median is slower than the baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed slowdown against the baseline (0.2 = 20%%)')
+    args = parser.parse_args(argv[1:])
+
+    results = run_benchmarks(args.projects, args.repeat, args.real)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as fd:
+            baseline = json.load(fd)
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump(results, fd, indent=2, sort_keys=True)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as fd:
+            json.dump(results, fd, indent=2, sort_keys=True)
+
+    if args.compare:
+        if baseline is None:
+            sys.exit("No baseline in {}, run with --save-baseline first.".format(args.baseline))
+        slower = regressions(results, baseline, args.threshold)
+        for name, slowdown in slower:
+            print("Regression: {} is {:.0%} slower than the baseline".format(name, slowdown))
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
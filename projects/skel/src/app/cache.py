@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+
+"""
+Read-through response cache for the views.
+
+    @app.route('/')
+    @cached(ttl=60)
+    def index():
+        ...
+
+Two backends are available through CACHE_BACKEND:
+ - "memory": an LRU dict per process, evicting the least recently used
+   entries once CACHE_MAX_BYTES is reached;
+ - "sqlite": a SQLite file (CACHE_SQLITE_PATH) shared by every worker
+   process, a local stand-in for a shared cache server.
+
+A missing entry is computed once: the other requests for the same key wait
+for it instead of all recomputing it (single flight, across processes for
+the shared backend).
+"""
+
+import os
+import time
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request, make_response
+
+
+MISSING = object()
+
+
+class MemoryBackend(object):
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return MISSING
+            expires, value, size = entry
+            if expires < time.time():
+                self._remove(key)
+                return MISSING
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.time() + ttl, value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+
+    def add(self, key, value, ttl):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] >= time.time():
+                return False
+        self.set(key, value, ttl)
+        return True
+
+    def delete(self, key):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+    def _remove(self, key):
+        expires, value, size = self.entries.pop(key)
+        self.size -= size
+
+
+class SQLiteBackend(object):
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires REAL)'
+        )
+
+    @property
+    def connection(self):
+        # sqlite3 connections can not be shared between threads
+        connection = getattr(self.local, 'connection', None)
+        if connection is None or getattr(self.local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return connection
+
+    def get(self, key):
+        row = self.connection.execute(
+            'SELECT value FROM cache WHERE key = ? AND expires >= ?', (key, time.time())
+        ).fetchone()
+        if row is None:
+            return MISSING
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.time() + ttl)
+        )
+
+    def add(self, key, value, ttl):
+        now = time.time()
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('DELETE FROM cache WHERE key = ? AND expires < ?', (key, now))
+            cursor = connection.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), now + ttl)
+            )
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return cursor.rowcount == 1
+
+    def delete(self, key):
+        self.connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+
+class Cache(object):
+    def __init__(self, app=None):
+        self.backend = None
+        self.default_ttl = 60
+        self.lock_ttl = 10
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.stats_lock = threading.Lock()
+        # Metric counters by name, see app/metrics.py
+        self.counters = {}
+        # Keys being computed in this process, and the event set when done
+        self.in_flight = {}
+        self.in_flight_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        if config.get('CACHE_BACKEND', 'memory') == 'sqlite':
+            self.backend = SQLiteBackend(config.get('CACHE_SQLITE_PATH'))
+        else:
+            self.backend = MemoryBackend(config.get('CACHE_MAX_BYTES', 64 * 1024 * 1024))
+        self.default_ttl = config.get('CACHE_DEFAULT_TTL', 60)
+        self.lock_ttl = config.get('CACHE_LOCK_TTL', 10)
+        app.extensions['response_cache'] = self
+
+    def count(self, name):
+        with self.stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+        counter = self.counters.get(name)
+        if counter is not None:
+            counter.inc()
+
+    @property
+    def stats(self):
+        with self.stats_lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'waits': self.waits,
+                'hit_ratio': float(self.hits) / total if total else 0.0,
+            }
+
+    def get_or_compute(self, key, ttl, compute):
+        value = self.backend.get(key)
+        if value is not MISSING:
+            self.count('hits')
+            return value
+
+        # Single flight in this process: the first request computes, the
+        # others wait for its event. No lock is held during the computation.
+        with self.in_flight_lock:
+            done = self.in_flight.get(key)
+            if done is None:
+                self.in_flight[key] = threading.Event()
+        if done is not None:
+            self.count('waits')
+            done.wait(self.lock_ttl)
+            value = self.backend.get(key)
+            if value is not MISSING:
+                self.count('hits')
+                return value
+            # Not cacheable, failed or too slow: compute it here
+            self.count('misses')
+            return self.compute(key, ttl, compute)
+
+        try:
+            value = self.backend.get(key)
+            if value is not MISSING:
+                self.count('hits')
+                return value
+            self.count('misses')
+            return self.compute_once(key, ttl, compute)
+        finally:
+            with self.in_flight_lock:
+                self.in_flight.pop(key).set()
+
+    def compute_once(self, key, ttl, compute):
+        # Single flight across processes sharing the backend
+        lock_key = 'lock:' + key
+        owner = self.backend.add(lock_key, os.getpid(), self.lock_ttl)
+        if not owner:
+            self.count('waits')
+            deadline = time.time() + self.lock_ttl
+            while time.time() < deadline:
+                time.sleep(0.01)
+                value = self.backend.get(key)
+                if value is not MISSING:
+                    return value
+        try:
+            return self.compute(key, ttl, compute)
+        finally:
+            if owner:
+                self.backend.delete(lock_key)
+
+    def compute(self, key, ttl, compute):
+        value = compute()
+        if value is not None:
+            self.backend.set(key, value, ttl)
+        return value
+
+
+def request_key():
+    return 'view:' + request.full_path
+
+
+def cached(ttl=None, key=None):
+    """
+    Cache the response of a view.
+
+    :param ttl: Seconds a response is kept, CACHE_DEFAULT_TTL by default.
+    :param key: Callable returning the cache key, the path with the query
+    string by default.
+    """
+    def decorator(view):
+        @wraps(view)
+        def decorated(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(*args, **kwargs)
+            cache = current_app.extensions['response_cache']
+            computed = []
+
+            def compute():
+                response = make_response(view(*args, **kwargs))
+                computed.append(response)
+                if response.status_code != 200 or response.is_streamed:
+                    return None
+                return response.get_data(), response.status_code, list(response.headers.items())
+
+            cached_key = key() if key is not None else request_key()
+            value = cache.get_or_compute(cached_key, ttl or cache.default_ttl, compute)
+            if computed:
+                return computed[0]
+            if value is None:
+                # Another request computed a response that can not be cached
+                return view(*args, **kwargs)
+            body, status, headers = value
+            return current_app.response_class(body, status=status, headers=headers)
+        return decorated
+    return decorator
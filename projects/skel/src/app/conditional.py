@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+"""
+Conditional requests: clients and CDNs revalidate with If-None-Match or
+If-Modified-Since and get an empty 304 when nothing changed.
+
+Two layers:
+ - every GET or HEAD 200 response without validators gets a strong ETag,
+   the hash of its body (CONDITIONAL_AUTO_ETAG). The view still runs, only
+   the bandwidth is saved;
+ - views decorated with @conditional compute their validators first, from
+   something cheaper than the response, and are not run at all when the
+   client copy is still valid:
+
+    @app.route('/users/<int:user_id>')
+    @conditional(User.validators, weak=True)
+    def user(user_id):
+        ...
+
+   The validators function gets the arguments of the view and returns the
+   (etag, last_modified) pair, either may be None.
+"""
+
+import hashlib
+from datetime import timezone
+from functools import wraps
+
+from flask import current_app, request, make_response
+from werkzeug.http import parse_etags, parse_date, quote_etag, unquote_etag, http_date
+
+
+# Headers a 304 response keeps from the full one (RFC 7232, section 4.1)
+KEPT_HEADERS = ('Cache-Control', 'Content-Location', 'Date', 'ETag', 'Expires', 'Last-Modified', 'Vary')
+
+
+def utc(moment):
+    # Naive datetimes are UTC, as in the database
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment.replace(microsecond=0)
+
+
+def is_not_modified(etag=None, last_modified=None):
+    """
+    :param etag: The quoted ETag of the current version, weak or strong.
+    :param last_modified: The datetime of the current version.
+    """
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        # If-None-Match wins over If-Modified-Since, with the weak comparison
+        if etag is None:
+            return False
+        return parse_etags(if_none_match).contains_weak(unquote_etag(etag)[0])
+    since = parse_date(request.headers.get('If-Modified-Since'))
+    if since is None or last_modified is None:
+        return False
+    return utc(last_modified) <= utc(since)
+
+
+def not_modified(headers):
+    response = current_app.response_class(status=304)
+    for name in KEPT_HEADERS:
+        if name in headers:
+            response.headers[name] = headers[name]
+    return response
+
+
+def set_validators(response, etag=None, last_modified=None):
+    if etag is not None:
+        response.headers['ETag'] = etag
+    if last_modified is not None:
+        response.headers['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def conditional(validators, weak=False):
+    """
+    Answer 304 before the view is run when the validators match the request.
+
+    :param validators: Callable taking the view arguments, returning (etag, last_modified).
+    :param weak: The ETag is weak: the representation is equivalent, not byte for byte identical.
+    """
+    def decorator(view):
+        @wraps(view)
+        def decorated(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(*args, **kwargs)
+            etag, last_modified = validators(*args, **kwargs)
+            if etag is not None:
+                etag = quote_etag(etag, weak)
+            if is_not_modified(etag, last_modified):
+                return set_validators(current_app.response_class(status=304), etag, last_modified)
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                set_validators(response, etag, last_modified)
+            return response
+        return decorated
+    return decorator
+
+
+def auto_etag(response):
+    if request.method not in ('GET', 'HEAD') or response.status_code != 200:
+        return response
+    if response.is_streamed or response.direct_passthrough or 'ETag' in response.headers:
+        return response
+    response.headers['ETag'] = quote_etag(hashlib.blake2b(response.get_data(), digest_size=16).hexdigest())
+    if is_not_modified(response.headers['ETag'], None):
+        return not_modified(response.headers)
+    return response
+
+
+def init_conditional(app):
+    if app.config.get('CONDITIONAL_AUTO_ETAG', True):
+        app.after_request(auto_etag)
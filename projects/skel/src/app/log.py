@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+"""
+Non-blocking logging.
+
+Request threads only put records on a queue. A listener thread per process
+writes them to the log file in batches, with size-based rotation. A quiet
+process still writes its last records within a couple of flush intervals:
+the listener flushes the batch when no record came for one interval. Every
+process writes its own file, so rotation never races between processes:
+app_logger.worker<n>.log for the worker in slot n of the server (set by
+gunicorn_config.py), so a recycled worker takes over the files of the one
+it replaces, app_logger.<pid>.log for the others.
+"""
+
+import os
+import time
+import queue
+import logging
+from logging.handlers import QueueHandler, QueueListener, MemoryHandler, RotatingFileHandler
+
+
+class BatchHandler(MemoryHandler):
+    """
+    Buffers records and hands them to the file handler in one go, when the
+    buffer is full, on an error, or when flush_interval seconds passed.
+    """
+
+    def __init__(self, capacity, target, flush_interval=1.0):
+        MemoryHandler.__init__(self, capacity, flushLevel=logging.ERROR, target=target)
+        self.flush_interval = flush_interval
+        self.last_flush = time.monotonic()
+
+    def shouldFlush(self, record):
+        return MemoryHandler.shouldFlush(self, record) or time.monotonic() - self.last_flush > self.flush_interval
+
+    def flush(self):
+        MemoryHandler.flush(self)
+        self.last_flush = time.monotonic()
+
+
+class BatchListener(QueueListener):
+    """
+    Queue listener waiting at most flush_interval for the next record, and
+    flushing the batch handlers meanwhile.
+    """
+
+    def __init__(self, records, *handlers, flush_interval=1.0, **kwargs):
+        QueueListener.__init__(self, records, *handlers, **kwargs)
+        self.flush_interval = flush_interval
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(block, timeout=self.flush_interval)
+            except queue.Empty:
+                if not block:
+                    raise
+                for handler in self.handlers:
+                    handler.flush()
+
+
+class LogPipeline(object):
+    def __init__(self, app):
+        self.app = app
+        self.listener = None
+        self.queue_handler = None
+        # Slot of this worker process, and of the next one forked
+        self.worker = None
+        self.next_worker = None
+
+    @property
+    def log_file(self):
+        log_file = self.app.config.get('LOG_FILE')
+        if self.app.config.get('LOG_PER_PROCESS', True):
+            root, ext = os.path.splitext(log_file)
+            name = 'worker{}'.format(self.worker) if self.worker is not None else os.getpid()
+            log_file = '{}.{}{}'.format(root, name, ext)
+        return log_file
+
+    def start(self):
+        config = self.app.config
+        log_file = self.log_file
+        os.makedirs(os.path.dirname(log_file), exist_ok=True)
+
+        file_handler = RotatingFileHandler(
+            log_file,
+            maxBytes=config.get('LOG_MAX_BYTES', 10 * 1024 * 1024),
+            backupCount=config.get('LOG_BACKUP_COUNT', 5),
+            delay=True
+        )
+        file_handler.setFormatter(
+            logging.Formatter(fmt='%(asctime)s %(name)s[%(process)d] %(levelname)s %(message)s', datefmt='%b %d %H:%M:%S')
+        )
+        flush_interval = config.get('LOG_FLUSH_INTERVAL', 1.0)
+        batch_handler = BatchHandler(config.get('LOG_BATCH_SIZE', 100), file_handler, flush_interval)
+
+        records = queue.Queue(-1)
+        self.listener = BatchListener(records, batch_handler, flush_interval=flush_interval, respect_handler_level=False)
+        self.listener.start()
+
+        if self.queue_handler is not None:
+            self.app.logger.removeHandler(self.queue_handler)
+        self.queue_handler = QueueHandler(records)
+        self.app.logger.addHandler(self.queue_handler)
+        self.app.logger.setLevel(config.get('LOG_LEVEL', 'INFO'))
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+            self.listener = None
+
+    def restart_in_child(self):
+        # The listener thread does not survive a fork (e.g. Gunicorn's preload_app):
+        # start a new one, writing to the file of the new process. Only the
+        # worker the slot was given to takes it, not the processes it forks.
+        self.listener = None
+        self.worker, self.next_worker = self.next_worker, None
+        self.start()
+
+
+def init_logging(app):
+    import atexit
+
+    pipeline = LogPipeline(app)
+    pipeline.start()
+    atexit.register(pipeline.stop)
+    app.extensions['log_pipeline'] = pipeline
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=pipeline.restart_in_child)
+    return pipeline
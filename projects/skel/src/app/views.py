@@ -3,7 +3,9 @@
 from flask import render_template
 
 from app import app
+from app.cache import cached
 
 @app.route('/', methods=['GET'])
+@cached(ttl=60)
 def index():
     return "<h1>Hello World</h1>"
\ No newline at end of file
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+# Production serving profile, used by "python manage.py serve".
+# Every value can be overridden from the environment.
+
+import os
+import multiprocessing
+
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+
+# (2 x CPU) + 1 workers keeps every core busy while some workers wait on I/O
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Import the app once in the master, the workers share its memory pages
+preload_app = True
+
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+backlog = int(os.environ.get('GUNICORN_BACKLOG', 2048))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+
+# Recycle the workers now and then to bound their memory, the jitter
+# avoids restarting all of them at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+accesslog = os.environ.get('GUNICORN_ACCESSLOG', '-')
+errorlog = '-'
+
+
+def on_starting(server):
+    # The metrics of a previous run would be added to this one
+    from app import metrics
+    metrics.store.clear()
+
+
+def pre_fork(server, worker):
+    # Log files are named after the slot of the worker, the lowest one free:
+    # a recycled worker writes on the files of the one it replaces instead
+    # of leaving them behind (see app/log.py)
+    from app import app
+    used = set(getattr(other, 'log_slot', None) for other in server.WORKERS.values())
+    worker.log_slot = min(slot for slot in range(len(used) + 1) if slot not in used)
+    app.extensions['log_pipeline'].next_worker = worker.log_slot
@@ -1,10 +1,47 @@
 # -*- coding: utf-8 -*-
 
-from flask.ext.script import Manager
+import os
+import sys
 
+import click
+
+import build_assets
+import loadtest as loadtest_module
 from app import app
 
-manager = Manager(app)
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+
+@click.group()
+@click.pass_context
+def manager(context):
+    # Every command runs in an application context (current_app)
+    context.with_resource(app.app_context())
+
+@manager.command()
+@click.option('--host', default='127.0.0.1')
+@click.option('--port', default=5000)
+def runserver(host, port):
+    """Run the development server"""
+    app.run(host=host, port=port, debug=app.config.get('DEBUG', False))
+
+@manager.command()
+def assets():
+    """Bundle, minify, hash and pre-compress the static files (see build_assets.py)"""
+    for name, filename in sorted(build_assets.build().items()):
+        print("{:<12} {}".format(name, filename))
+
+@manager.command()
+def serve():
+    """Run the app under Gunicorn with the production profile of gunicorn_config.py"""
+    os.chdir(basedir)
+    os.execv(sys.executable, [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn_config.py', 'wsgi:application'])
+
+@manager.command(context_settings={'ignore_unknown_options': True, 'help_option_names': []})
+@click.argument('args', nargs=-1, type=click.UNPROCESSED)
+def loadtest(args):
+    """Measure throughput and latency of the running app (options: python loadtest.py -h)"""
+    loadtest_module.main(list(args))
 
 if __name__ == '__main__':
-    manager.run()
+    manager()
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+
+from app import app
+
+application = app
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+from quart import Quart
+
+from app.assets import Assets
+from app.conditional import init_conditional
+from app.database import Database
+from app.http import HttpClient
+from app.passwords import PasswordHasher
+
+# App Initialization
+# Quart is the asyncio implementation of the Flask API, served over ASGI
+app = Quart(__name__)
+app.config.from_object('config')
+
+# Jinja2 Setup
+app.jinja_env.trim_blocks = True
+
+# Hashed, pre-compressed bundles of manage.py assets, asset_url() in the templates (see app/assets.py)
+assets = Assets(app)
+
+# ETag on every response and 304 answers to conditional requests (see app/conditional.py)
+init_conditional(app)
+
+# Async engine and request-scoped sessions (see app/database.py)
+db = Database(app)
+
+# One connection pool to the upstream services, shared by every request (see app/http.py)
+http = HttpClient(app)
+
+# Password hashing policy and bounded hashing pool
+passwords = PasswordHasher(app)
+
+from app import views, models
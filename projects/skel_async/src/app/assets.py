@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+"""
+Serving of the bundles built by build_assets.py ("python manage.py assets").
+
+In the templates, asset_url('vendor.css') is the url of the current hashed
+bundle. A hashed file never changes, so it is sent with far-future
+immutable cache headers, and as its pre-compressed brotli or gzip variant
+when the client accepts it.
+"""
+
+import os
+import json
+import mimetypes
+
+from quart import request, url_for, send_from_directory, abort
+
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+class Assets(object):
+    def __init__(self, app=None):
+        self.directory = None
+        self.manifest_mtime = None
+        self.files = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = os.path.join(app.static_folder, 'dist')
+        app.add_url_rule(app.config.get('ASSETS_URL_PATH', '/assets') + '/<path:filename>', 'assets', self.send)
+        app.jinja_env.globals['asset_url'] = self.url
+        app.extensions['assets'] = self
+
+    @property
+    def manifest(self):
+        # Reloaded when "manage.py assets" wrote a new one
+        path = os.path.join(self.directory, 'manifest.json')
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return self.files
+        if mtime != self.manifest_mtime:
+            with open(path) as fd:
+                self.files = json.load(fd)
+            self.manifest_mtime = mtime
+        return self.files
+
+    def url(self, name):
+        return url_for('assets', filename=self.manifest.get(name, name))
+
+    async def send(self, filename):
+        path = os.path.join(self.directory, filename)
+        if not os.path.isfile(path):
+            abort(404)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+        accepted = request.accept_encodings
+        for encoding, ext in ENCODINGS:
+            if encoding in accepted and os.path.isfile(path + ext):
+                response = await send_from_directory(self.directory, filename + ext, mimetype=mimetype)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = await send_from_directory(self.directory, filename, mimetype=mimetype)
+        response.headers['Vary'] = 'Accept-Encoding'
+        if filename in self.manifest.values():
+            response.headers['Cache-Control'] = IMMUTABLE
+        return response
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""
+Async database access: an asyncio SQLAlchemy engine (aiosqlite for SQLite)
+and one AsyncSession per request, closed when the request ends.
+
+    user = await User.get(db.session(), user_id)
+
+The pragmas of SQLITE_PRAGMAS are set on every new connection, and the
+connection pool is sized from DB_POOL_SIZE, DB_MAX_OVERFLOW and
+DB_POOL_RECYCLE.
+"""
+
+import os
+
+from quart import g
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import DeclarativeBase
+
+
+class Model(DeclarativeBase):
+    pass
+
+
+def engine_options(config):
+    return {
+        'pool_size': config.get('DB_POOL_SIZE', 5),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 10),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 3600),
+    }
+
+
+class Database(object):
+    Model = Model
+
+    def __init__(self, app=None):
+        self.engine = None
+        self.sessionmaker = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.uri = config['DATABASE_URI']
+        options = engine_options(config)
+        options.update(config.get('DATABASE_ENGINE_OPTIONS', {}))
+        self.engine = create_async_engine(self.uri, **options)
+        # Objects stay usable after a commit, without another round trip
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+
+        pragmas = list(config.get('SQLITE_PRAGMAS', []))
+
+        @event.listens_for(self.engine.sync_engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            if not self.uri.startswith('sqlite'):
+                return
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas:
+                cursor.execute('PRAGMA {} = {}'.format(name, value))
+            cursor.close()
+
+        app.teardown_appcontext(self.close_session)
+        app.after_serving(self.dispose)
+        app.extensions['database'] = self
+
+    def session(self):
+        """
+        The session of the current request, created on first use.
+        """
+        if 'db_session' not in g:
+            g.db_session = self.sessionmaker()
+        return g.db_session
+
+    async def close_session(self, exception=None):
+        session = g.pop('db_session', None)
+        if session is not None:
+            await session.close()
+
+    async def dispose(self):
+        await self.engine.dispose()
+
+    async def create_all(self):
+        if self.uri.startswith('sqlite') and ':///' in self.uri:
+            os.makedirs(os.path.dirname(self.uri.split(':///', 1)[1]), exist_ok=True)
+        async with self.engine.begin() as connection:
+            await connection.run_sync(Model.metadata.create_all)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+"""
+Calls to upstream services.
+
+A single httpx.AsyncClient is shared by every request of the worker, so
+connections are pooled and kept alive instead of opened for each call
+(HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE). Every call has a timeout
+(HTTP_TIMEOUT): a slow upstream costs a pending coroutine, never a blocked
+thread.
+
+    data = await http.get_json(url)
+    results = await http.gather_json(first_url, second_url)
+"""
+
+import asyncio
+
+import httpx
+
+
+class HttpClient(object):
+    def __init__(self, app=None):
+        self.client = None
+        self.timeout = 10
+        self.limits = httpx.Limits()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.timeout = config.get('HTTP_TIMEOUT', self.timeout)
+        self.limits = httpx.Limits(
+            max_connections=config.get('HTTP_MAX_CONNECTIONS', 100),
+            max_keepalive_connections=config.get('HTTP_MAX_KEEPALIVE', 20),
+        )
+        app.before_serving(self.open)
+        app.after_serving(self.close)
+        app.extensions['http_client'] = self
+
+    async def open(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+        return self.client
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def get_json(self, url, **kwargs):
+        client = self.client or await self.open()
+        response = await client.get(url, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    async def gather_json(self, *urls, **kwargs):
+        """
+        Fetch every url concurrently: the whole call takes as long as the
+        slowest upstream, not the sum of all of them.
+
+        :return: The decoded body of every url, or the exception it raised.
+        """
+        return await asyncio.gather(*(self.get_json(url, **kwargs) for url in urls), return_exceptions=True)
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+
+import json
+import base64
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Index, select, func, or_, and_
+
+from app import app, db, passwords
+
+
+class InvalidCursor(ValueError):
+    """A pagination cursor that was not made by User.encode_cursor (altered, truncated...)."""
+
+
+class User(db.Model):
+    """
+    User model, used through an AsyncSession: every method that touches the
+    database is a coroutine taking the session.
+
+    id: The ID of the user.
+    username: The username of the user (can contain any characters)
+    password: Encrypted password
+    superuser: Boolean to tell if the user is a superuser
+    active: Boolean to tell if the user is active (ability to login and operate on the app)
+    register_date: The date the user registered
+    last_login: The date the user last logged in the app
+    updated_at: The date of the last change of the row, set on every insert and update
+    """
+
+    __tablename__ = 'user'
+
+    id = Column(Integer, primary_key=True)
+    username = Column(String(50), unique=True)
+    password = Column(String(255))
+    superuser = Column(Boolean())
+    active = Column(Boolean())
+    register_date = Column(DateTime())
+    last_login = Column(DateTime())
+    updated_at = Column(DateTime(), default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Indexes for the admin listings: active users by last login, and sorting
+    # everybody by last login or registration date
+    __table_args__ = (
+        Index('ix_user_active_last_login', 'active', 'last_login'),
+        Index('ix_user_last_login', 'last_login'),
+        Index('ix_user_register_date', 'register_date'),
+        # Last change of the listing for User.validators
+        Index('ix_user_updated_at', 'updated_at'),
+    )
+
+    # Columns the keyset pagination can sort on
+    sort_columns = ('id', 'last_login', 'register_date')
+
+    def __init__(self, username, password_hash, superuser=False, active=True, register_date=None, last_login=None):
+        """
+        Hashing is too slow for a constructor running on the event loop,
+        use User.create() to make a user from a raw password.
+
+        :param username: The username of the user.
+        :param password_hash: The password, already hashed.
+        :param active: Set if the user is active or not (restrains from logging for example)
+        :param superuser: Set if the user is a superuser
+        :param register_date: Set the date of registration (defaults to "now")
+        :param last_login:
+        """
+        now = datetime.utcnow()
+        self.username = username
+        self.password = password_hash
+        self.superuser = superuser
+        self.active = active
+        self.register_date = register_date or now
+        self.last_login = last_login or now
+
+    @classmethod
+    async def create(cls, session, username, password, **kwargs):
+        """
+        :param password: The raw password, hashed on the hashing pool.
+        :return: The new user, or None when it could not be saved.
+        """
+        user = cls(username, await passwords.hash_async(password), **kwargs)
+        if not await user.save(session):
+            return None
+        return user
+
+    @classmethod
+    async def get(cls, session, user_id):
+        return await session.get(cls, user_id)
+
+    @classmethod
+    async def by_username(cls, session, username):
+        return await session.scalar(select(cls).where(cls.username == username))
+
+    async def save(self, session):
+        """
+        Save method. Allows to easily save a single object.
+        Also logs the errors in case of Exception.
+        :return: True if the operation succeed, False otherwise.
+        """
+        session.add(self)
+        try:
+            await session.commit()
+        except Exception as e:
+            app.logger.exception("Something went wrong while saving a user {}".format(e))
+            await session.rollback()
+            return False
+        return True
+
+    async def delete(self, session):
+        """
+        Delete method allows to easily delete a single object.
+        :return: True if the operation succeed, False otherwise.
+        """
+        await session.delete(self)
+        try:
+            await session.commit()
+        except Exception as e:
+            app.logger.exception("Something went wrong while deleting a user {}".format(e))
+            await session.rollback()
+            return False
+        return True
+
+    @classmethod
+    def encode_cursor(cls, value, user_id):
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        data = json.dumps([value, user_id]).encode('utf-8')
+        return base64.urlsafe_b64encode(data).decode('ascii')
+
+    @classmethod
+    def decode_cursor(cls, cursor, order_by):
+        """
+        :raise InvalidCursor: When the cursor was not made by encode_cursor for that order.
+        """
+        try:
+            value, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+            if not isinstance(user_id, int):
+                raise ValueError("user id {!r}".format(user_id))
+            if order_by == 'id':
+                if not isinstance(value, int):
+                    raise ValueError("id {!r}".format(value))
+            elif value is not None:
+                value = datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%f' if '.' in value else '%Y-%m-%dT%H:%M:%S')
+        except (TypeError, ValueError) as e:
+            raise InvalidCursor("Invalid cursor {!r}: {}".format(cursor, e))
+        return value, user_id
+
+    @classmethod
+    def after_cursor(cls, column, value, user_id, descending):
+        """
+        Condition of the rows after the cursor. NULLs sort before every value
+        (see sorted_query), so they come last in descending order.
+        """
+        if value is None:
+            if descending:
+                return and_(column.is_(None), cls.id < user_id)
+            return or_(column.isnot(None), and_(column.is_(None), cls.id > user_id))
+        if descending:
+            return or_(column < value, and_(column == value, cls.id < user_id), column.is_(None))
+        return or_(column > value, and_(column == value, cls.id > user_id))
+
+    @classmethod
+    def sorted_query(cls, order_by='last_login', descending=True, active=None):
+        if order_by not in cls.sort_columns:
+            raise ValueError("Users can only be sorted by {}".format(", ".join(cls.sort_columns)))
+        column = getattr(cls, order_by)
+        query = select(cls)
+        if active is not None:
+            query = query.where(cls.active == active)
+        # The id breaks ties, so the order (and every cursor) is stable. NULLs
+        # sort first as on SQLite (whose indexes are then still used), on
+        # every database.
+        if descending:
+            return query.order_by(column.desc().nulls_last(), cls.id.desc()), column
+        return query.order_by(column.asc().nulls_first(), cls.id.asc()), column
+
+    @classmethod
+    async def page(cls, session, cursor=None, limit=50, order_by='last_login', descending=True, active=None):
+        """
+        One page of users by keyset (seek) pagination.
+        :param cursor: The cursor returned with the previous page, None for the first one.
+        :raise InvalidCursor: When the cursor is not one of a previous page.
+        :return: The users of the page and the cursor of the next page (None on the last one).
+        """
+        query, column = cls.sorted_query(order_by, descending, active)
+        if cursor is not None:
+            value, user_id = cls.decode_cursor(cursor, order_by)
+            query = query.where(cls.after_cursor(column, value, user_id, descending))
+        users = list(await session.scalars(query.limit(limit + 1)))
+        if len(users) <= limit:
+            return users, None
+        users = users[:limit]
+        last = users[-1]
+        return users, cls.encode_cursor(getattr(last, order_by), last.id)
+
+    @classmethod
+    async def stream(cls, session, order_by='id', descending=False, active=None, batch_size=1000):
+        """
+        Iterate over every user, batch_size rows at a time:
+
+            async for user in await User.stream(session):
+                ...
+        """
+        query = cls.sorted_query(order_by, descending, active)[0]
+        return await session.stream_scalars(query.execution_options(yield_per=batch_size))
+
+    @classmethod
+    async def validators(cls, user_id=None, active=None):
+        """
+        ETag and Last-Modified of a user, or of the user listing, for
+        app.conditional. They come from the id and updated_at columns (an
+        aggregate on their indexes for the listing), no row is loaded.
+        Every insert, update and delete through SQLAlchemy changes them;
+        a raw SQL update must set updated_at itself.
+        :return: (etag, last_modified), (None, None) for an unknown user.
+        """
+        session = db.session()
+        if user_id is not None:
+            row = (await session.execute(select(cls.updated_at).where(cls.id == user_id))).first()
+            if row is None:
+                return None, None
+            updated_at = row[0]
+            return 'user-{}-{}'.format(user_id, updated_at.isoformat() if updated_at else ''), updated_at
+        query = select(func.count(cls.id), func.max(cls.id), func.max(cls.updated_at))
+        if active is not None:
+            query = query.where(cls.active == active)
+        count, last_id, updated_at = (await session.execute(query)).one()
+        return 'users-{}-{}-{}'.format(count, last_id or 0, updated_at.isoformat() if updated_at else ''), updated_at
+
+    def is_superuser(self):
+        return self.superuser
+
+    async def set_password(self, password):
+        self.password = await passwords.hash_async(password)
+
+    async def check_password(self, session, password):
+        """
+        Verify the password on the hashing pool (see app/passwords.py).
+        A hash made under an older policy is replaced after a successful check.
+        :raise PasswordHasherBusy: When every hashing slot stayed busy.
+        """
+        if not await passwords.verify_async(self.password, password):
+            return False
+        if passwords.needs_rehash(self.password):
+            await self.set_password(password)
+            await self.save(session)
+        return True
+
+    def is_authenticated(self):
+        return True
+
+    def is_active(self):
+        return self.active
+
+    def is_anonymous(self):
+        return False
+
+    def get_id(self):
+        return self.id
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'username': self.username,
+            'superuser': self.superuser,
+            'active': self.active,
+            'register_date': self.register_date.isoformat() if self.register_date else None,
+            'last_login': self.last_login.isoformat() if self.last_login else None,
+        }
+
+    def __repr__(self):
+        return "User(id={self.id!r}, username={self.username!r}, superuser={self.superuser!r}, " \
+               "active={self.active!r}, register_date={self.register_date!r}, last_login={self.last_login!r})".format(
+                   self=self
+               )
+
+    def __str__(self):
+        return self.username
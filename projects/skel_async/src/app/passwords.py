@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+"""
+Password hashing policy.
+
+PASSWORD_HASH_METHOD is the Werkzeug method, iterations included (for
+example 'pbkdf2:sha256:600000'). Hashes made with another method are
+upgraded on the next successful login. Werkzeug completes a short method
+('scrypt', 'pbkdf2') with its current defaults, so the method a hash is
+compared with is read from a hash made once, when the app starts.
+
+Hashing is CPU bound, so it runs on a bounded pool (PASSWORD_HASH_POOL:
+'thread' or 'process') and at most PASSWORD_HASH_CONCURRENCY hashes run at
+once in a process. By default the cores are shared between the worker
+processes of the server (gunicorn_config.py calls set_workers): each one
+runs cpu_count // workers hashes at once, at least one. A request that can
+not get a slot within PASSWORD_HASH_TIMEOUT seconds gets
+PasswordHasherBusy, answered with a 503: a login storm then fails fast
+instead of starving every other endpoint.
+
+The async methods wait for the pool without blocking the event loop.
+"""
+
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+class PasswordHasher(object):
+    def __init__(self, app=None):
+        self.method = 'pbkdf2:sha256:600000'
+        self.method_prefix = self.method
+        self.salt_length = 16
+        self.limit = None
+        self.concurrency = os.cpu_count() or 1
+        self.timeout = 5
+        self.pool_class = ThreadPoolExecutor
+        self.slots = None
+        self.executor = None
+        self.executor_pid = None
+        self.executor_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.method = config.get('PASSWORD_HASH_METHOD', self.method)
+        self.salt_length = config.get('PASSWORD_SALT_LENGTH', self.salt_length)
+        # 'scrypt' is stored as 'scrypt:32768:8:1', 'pbkdf2' as 'pbkdf2:sha256:1000000'
+        self.method_prefix = generate_password_hash('', self.method, self.salt_length).split('$', 1)[0]
+        self.limit = config.get('PASSWORD_HASH_CONCURRENCY')
+        self.timeout = config.get('PASSWORD_HASH_TIMEOUT', self.timeout)
+        if config.get('PASSWORD_HASH_POOL', 'thread') == 'process':
+            self.pool_class = ProcessPoolExecutor
+        self.set_workers(1)
+        app.register_error_handler(PasswordHasherBusy, self.busy)
+        app.extensions['password_hasher'] = self
+
+    def set_workers(self, workers):
+        """
+        Size the hashing slots of this process for a server of that many
+        worker processes, unless PASSWORD_HASH_CONCURRENCY sets them.
+        """
+        self.concurrency = self.limit or max(1, (os.cpu_count() or 1) // workers)
+        self.slots = threading.BoundedSemaphore(self.concurrency)
+
+    def busy(self, error):
+        return str(error), 503, {'Retry-After': str(int(self.timeout) or 1)}
+
+    def get_executor(self):
+        # Created on first use in each process, a pool does not survive a fork
+        with self.executor_lock:
+            if self.executor is None or self.executor_pid != os.getpid():
+                self.executor = self.pool_class(max_workers=self.concurrency)
+                self.executor_pid = os.getpid()
+            return self.executor
+
+    def run(self, func, *args):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise PasswordHasherBusy("Too many password hashes in progress.")
+        try:
+            return self.get_executor().submit(func, *args).result()
+        finally:
+            self.slots.release()
+
+    def hash(self, password):
+        return self.run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, pwhash, password):
+        if not pwhash:
+            return False
+        return self.run(check_password_hash, pwhash, password)
+
+    async def run_async(self, func, *args):
+        # Waiting for a slot and for the pool happens on a thread of the loop executor
+        return await asyncio.get_running_loop().run_in_executor(None, self.run, func, *args)
+
+    async def hash_async(self, password):
+        return await self.run_async(generate_password_hash, password, self.method, self.salt_length)
+
+    async def verify_async(self, pwhash, password):
+        if not pwhash:
+            return False
+        return await self.run_async(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        return pwhash.split('$', 1)[0] != self.method_prefix
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+
+
+# Please fix this file according to your python version.
+try:
+    from .main import index
+except ImportError:
+    from main import index
\ No newline at end of file
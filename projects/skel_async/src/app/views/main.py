@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+from quart import abort, jsonify, request
+
+from app import app, db, http
+from app.conditional import conditional
+from app.models import User, InvalidCursor
+
+
+@app.route('/', methods=['GET'])
+async def index():
+    return "<h1>Hello World</h1>"
+
+
+@app.route('/users', methods=['GET'])
+@conditional(User.validators, weak=True)
+async def users():
+    try:
+        page, cursor = await User.page(db.session(), cursor=request.args.get('cursor'), limit=50)
+    except InvalidCursor:
+        abort(400)
+    return jsonify(users=[user.as_dict() for user in page], next=cursor)
+
+
+@app.route('/users/<int:user_id>', methods=['GET'])
+@conditional(User.validators, weak=True)
+async def user(user_id):
+    user = await User.get(db.session(), user_id)
+    if user is None:
+        abort(404)
+    return jsonify(user.as_dict())
+
+
+@app.route('/upstreams', methods=['GET'])
+async def upstreams():
+    # Every upstream is called at once, the worker serves other requests meanwhile
+    urls = app.config.get('UPSTREAM_URLS', [])
+    results = await http.gather_json(*urls)
+    return jsonify({
+        url: {'error': repr(result)} if isinstance(result, Exception) else result
+        for url, result in zip(urls, results)
+    })
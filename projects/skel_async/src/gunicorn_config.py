@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+# Production serving profile, used by "python manage.py serve".
+# Every value can be overridden from the environment.
+
+import os
+import multiprocessing
+
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+
+# One event loop per core: a worker waits on thousands of requests at once,
+# more workers than cores would only compete for the CPU
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'uvicorn.workers.UvicornWorker'
+
+# Import the app once in the master, the workers share its memory pages
+preload_app = True
+
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+backlog = int(os.environ.get('GUNICORN_BACKLOG', 2048))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+
+# Recycle the workers now and then to bound their memory, the jitter
+# avoids restarting all of them at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+
+accesslog = os.environ.get('GUNICORN_ACCESSLOG', '-')
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    # Connections the master may have opened belong to its event loop:
+    # each worker starts with a fresh pool.
+    from app import db, passwords
+    db.engine.sync_engine.dispose(close=False)
+    # The cores are shared by the workers: a login storm must not take
+    # every one of them
+    passwords.set_workers(server.cfg.workers)
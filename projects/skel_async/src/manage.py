@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import asyncio
+
+import click
+
+import build_assets
+import loadtest as loadtest_module
+from app import app, db
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+
+@click.group()
+def manager():
+    pass
+
+@manager.command()
+@click.option('--host', default='127.0.0.1')
+@click.option('--port', default=5000)
+def runserver(host, port):
+    """Run the development server"""
+    app.run(host=host, port=port, debug=app.config.get('DEBUG', False))
+
+@manager.command()
+def serve():
+    """Run the app under Gunicorn with Uvicorn workers, with the production profile of gunicorn_config.py"""
+    os.chdir(basedir)
+    os.execv(sys.executable, [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn_config.py', 'asgi:application'])
+
+@manager.command()
+def assets():
+    """Bundle, minify, hash and pre-compress the static files (see build_assets.py)"""
+    for name, filename in sorted(build_assets.build().items()):
+        print("{:<12} {}".format(name, filename))
+
+@manager.command('create_db')
+def create_db():
+    asyncio.run(db.create_all())
+
+@manager.command(context_settings={'ignore_unknown_options': True, 'help_option_names': []})
+@click.argument('args', nargs=-1, type=click.UNPROCESSED)
+def loadtest(args):
+    """Measure throughput and latency of the running app (options: python loadtest.py -h)"""
+    loadtest_module.main(list(args))
+
+if __name__ == "__main__":
+    manager()
@@ -1,11 +1,17 @@
 # -*- coding: utf-8 -*-
 
-import logging
-from logging.handlers import RotatingFileHandler
-
 from flask_sqlalchemy import SQLAlchemy
 from flask import Flask
-from werkzeug.contrib.fixers import ProxyFix
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from app.assets import Assets
+from app.conditional import init_conditional
+from app.cache import Cache
+from app.database import init_database, pool_metrics, RoutingSession
+from app.log import init_logging
+from app.metrics import Metrics
+from app.profiling import init_profiling, profile_sql
+from app.passwords import PasswordHasher
 
 # App Initialization
 app = Flask(__name__)
@@ -15,14 +21,32 @@ app.wsgi_app = ProxyFix(app.wsgi_app)
 # Jinja2 Setup
 app.jinja_env.trim_blocks = True
 
-# Logging with Rotating File Setup
-handler = RotatingFileHandler(app.config.get('LOG_FILE'), maxBytes=10000, backupCount=5)
-handler.setLevel(logging.DEBUG)
-handler.setFormatter(
-    logging.Formatter(fmt='%(asctime)s %(name)s[%(process)d] %(levelname)s %(message)s', datefmt='%b %d %H:%M:%S')
-)
-app.logger.addHandler(handler)
+# Hashed, pre-compressed bundles of manage.py assets, asset_url() in the templates (see app/assets.py)
+assets = Assets(app)
+
+# ETag on every response and 304 answers to conditional requests (see app/conditional.py)
+init_conditional(app)
+
+# Logging through a queue, written by a background thread (see app/log.py)
+init_logging(app)
+
+# Response cache for the views decorated with app.cache.cached
+cache = Cache(app)
+
+# Prometheus metrics on /metrics, merged over the worker processes (see app/metrics.py)
+metrics = Metrics(app)
+
+# Server-Timing header, slow request log and sampled cProfile runs (see app/profiling.py)
+init_profiling(app)
+profile_sql()
+
+# SQLite pragmas and pool settings of the database profile, reads routed to
+# the replicas of DB_REPLICAS (see app/database.py)
+init_database(app)
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+pool_metrics(metrics, db)
 
-db = SQLAlchemy(app)
+# Password hashing policy and bounded hashing pool
+passwords = PasswordHasher(app)
 
 from app import views, models
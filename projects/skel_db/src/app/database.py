@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+"""
+SQLite tuning: the pragmas of SQLITE_PRAGMAS are set on every new
+connection, and the connection pool is sized from DB_POOL_SIZE,
+DB_MAX_OVERFLOW and DB_POOL_RECYCLE.
+
+Read replicas: every URI of DB_REPLICAS becomes a "replica_<n>" bind, and
+db.session (a RoutingSession) sends the SELECTs there, so reads neither
+wait for the pool nor for the write lock of the primary. Flushes, other
+statements and SELECT ... FOR UPDATE go to the primary. After the first
+of them, the session reads from the primary too, to see its own writes:
+the session lasts for the request, so does the stickiness. A view can ask
+for it before any write when it must not read stale rows:
+
+    db.session().use_primary()
+
+For local testing the replicas can be copies of a SQLite primary,
+refreshed by "python manage.py sync_replicas".
+"""
+
+import random
+import sqlite3
+
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql import Select
+
+
+def engine_options(config):
+    options = {
+        'pool_size': config.get('DB_POOL_SIZE', 5),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 10),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 3600),
+        # Errors and logs must not show the bound values, password hashes among them
+        'hide_parameters': True,
+    }
+    uri = config.get('SQLALCHEMY_DATABASE_URI', '')
+    if uri.startswith('sqlite') and ':memory:' not in uri and uri.rstrip('/') != 'sqlite:':
+        # Older SQLAlchemy versions give file databases a NullPool, which can not be sized
+        options['poolclass'] = QueuePool
+    return options
+
+
+def init_database(app):
+    options = engine_options(app.config)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    binds.update(replica_binds(app.config))
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+    pragmas = list(app.config.get('SQLITE_PRAGMAS', []))
+
+    @event.listens_for(Engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
+        cursor.close()
+
+
+def replica_binds(config):
+    return dict(('replica_{}'.format(index), uri) for index, uri in enumerate(config.get('DB_REPLICAS', [])))
+
+
+class RoutingSession(Session):
+    """
+    Flask-SQLAlchemy session sending the reads to a replica and the rest to
+    the primary (see above). One replica, drawn at random, serves the whole
+    session: its reads stay consistent with each other.
+    """
+
+    def __init__(self, db, **kwargs):
+        Session.__init__(self, db, **kwargs)
+        self.primary_only = False
+        self.replica = None
+
+    def use_primary(self):
+        """Read from the primary for the rest of the session (read your own writes)."""
+        self.primary_only = True
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = Session.get_bind(self, mapper=mapper, clause=clause, bind=bind, **kwargs)
+        engines = self._db.engines
+        if bind is not None or engine is not engines.get(None):
+            # Explicit binds and models with their own bind key are not replicated
+            return engine
+        if self.primary_only or self._flushing or not is_read(clause):
+            self.primary_only = True
+            return engine
+        if self.replica is None:
+            replicas = [key for key in engines if key is not None and key.startswith('replica_')]
+            if not replicas:
+                return engine
+            self.replica = random.choice(replicas)
+        return engines[self.replica]
+
+
+def is_read(clause):
+    return isinstance(clause, Select) and clause._for_update_arg is None
+
+
+def sync_replicas(db):
+    """
+    Copy a SQLite primary over its SQLite replicas, with the online backup
+    API: the primary stays available meanwhile.
+    :return: The paths of the replicas written.
+    """
+    primary = db.engine.url
+    if primary.get_backend_name() != 'sqlite':
+        raise ValueError("Only the replicas of a SQLite primary can be copied.")
+    written = []
+    for key, engine in db.engines.items():
+        if key is None or not key.startswith('replica_'):
+            continue
+        if engine.url.get_backend_name() != 'sqlite':
+            raise ValueError("Replica {} is not a SQLite database.".format(engine.url))
+        # Connections of the pool would keep reading the old file
+        engine.dispose()
+        source = sqlite3.connect(primary.database)
+        target = sqlite3.connect(engine.url.database)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        written.append(engine.url.database)
+    return written
+
+
+def error_message(e):
+    """
+    Class and message of the error of a statement, without the statement and
+    its parameters: the driver error when there is one.
+    """
+    error = getattr(e, 'orig', None) or e
+    return '{}: {}'.format(type(error).__name__, error)
+
+
+def pool_metrics(metrics, db):
+    size = metrics.gauge('db_pool_size', 'Connections kept open by the pool.')
+    checked_out = metrics.gauge('db_pool_checked_out', 'Connections in use.')
+    overflow = metrics.gauge('db_pool_overflow', 'Connections opened beyond the pool size.')
+
+    @metrics.sampler
+    def sample_pool():
+        pool = db.engine.pool
+        if not isinstance(pool, QueuePool):
+            return
+        size.set((), pool.size())
+        checked_out.set((), pool.checkedout())
+        overflow.set((), max(pool.overflow(), 0))
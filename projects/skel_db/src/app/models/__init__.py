@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
 try:
-    from .user import User
+    from .user import User, InvalidCursor
 except ImportError:
-    from user import User
+    from user import User, InvalidCursor
@@ -1,10 +1,16 @@
 # -*- coding: utf-8 -*-
 
+import json
+import base64
+from concurrent.futures import Future
 from datetime import datetime
 
-from werkzeug.security import generate_password_hash, check_password_hash
+from app import app, db, passwords
+from app.database import error_message
 
-from app import app, db
+
+class InvalidCursor(ValueError):
+    """A pagination cursor that was not made by User.encode_cursor (altered, truncated...)."""
 
 
 class User(db.Model):
@@ -18,15 +24,30 @@ class User(db.Model):
     active: Boolean to tell if the user is active (ability to login and operate on the app)
     register_date: The date the user registered
     last_login: The date the user last logged in the app
+    updated_at: The date of the last change of the row, set on every insert and update
     """
 
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(50), unique=True)
-    password = db.Column(db.String(54))
+    password = db.Column(db.String(255))
     superuser = db.Column(db.Boolean())
     active = db.Column(db.Boolean())
     register_date = db.Column(db.DateTime())
     last_login = db.Column(db.DateTime())
+    updated_at = db.Column(db.DateTime(), default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Indexes for the admin listings: active users by last login, and sorting
+    # everybody by last login or registration date
+    __table_args__ = (
+        db.Index('ix_user_active_last_login', 'active', 'last_login'),
+        db.Index('ix_user_last_login', 'last_login'),
+        db.Index('ix_user_register_date', 'register_date'),
+        # Last change of the listing for User.validators
+        db.Index('ix_user_updated_at', 'updated_at'),
+    )
+
+    # Columns the keyset pagination can sort on
+    sort_columns = ('id', 'last_login', 'register_date')
 
     def __init__(self, username, password, superuser=False, active=True, register_date=None, last_login=None):
         """
@@ -83,14 +104,267 @@ class User(db.Model):
             return False
         return True
 
+    @classmethod
+    def chunks(cls, rows, chunk_size=None):
+        chunk_size = chunk_size or app.config.get('BULK_CHUNK_SIZE', 1000)
+        chunk = []
+        for index, row in enumerate(rows):
+            chunk.append((index, row))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    @classmethod
+    def apply_chunk(cls, chunk, apply):
+        """
+        Apply a whole chunk in one transaction. If it fails, the rows of the
+        chunk are applied again one by one, so only the bad rows are lost.
+        :return: The (index, error) of the rows that failed.
+        """
+        try:
+            apply([row for index, row in chunk])
+            db.session.commit()
+            return []
+        except Exception:
+            db.session.rollback()
+
+        errors = []
+        for index, row in chunk:
+            try:
+                apply([row])
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                errors.append((index, error_message(e)))
+        return errors
+
+    @classmethod
+    def mapping(cls, row):
+        """
+        Column values of a row given as User.__init__ keyword arguments.
+        A pre-computed 'password_hash' may be given instead of 'password',
+        otherwise the password is a Future of its hash (see bulk_run).
+        """
+        now = datetime.utcnow()
+        if 'password_hash' in row:
+            password = row['password_hash']
+        else:
+            password = passwords.hash_later(row['password'])
+        return {
+            'username': row['username'],
+            'password': password,
+            'superuser': row.get('superuser', False),
+            'active': row.get('active', True),
+            'register_date': row.get('register_date') or now,
+            'last_login': row.get('last_login') or now,
+        }
+
+    @staticmethod
+    def hashed(mapping):
+        # The mapping with the hash of its password, once computed
+        if isinstance(mapping, dict) and isinstance(mapping.get('password'), Future):
+            mapping['password'] = mapping['password'].result()
+        return mapping
+
+    @classmethod
+    def bulk_run(cls, rows, to_mapping, apply, chunk_size=None):
+        errors = []
+        for chunk in cls.chunks(rows, chunk_size):
+            mappings = []
+            for index, row in chunk:
+                try:
+                    mappings.append((index, to_mapping(row)))
+                except Exception as e:
+                    errors.append((index, "Invalid row: {}".format(error_message(e))))
+            # The passwords of the chunk were hashed in parallel meanwhile
+            hashed = []
+            for index, mapping in mappings:
+                try:
+                    hashed.append((index, cls.hashed(mapping)))
+                except Exception as e:
+                    errors.append((index, "Invalid row: {}".format(error_message(e))))
+            errors += cls.apply_chunk(hashed, apply)
+        errors.sort(key=lambda error: error[0])
+        for index, error in errors:
+            app.logger.error("Bulk operation on users failed for row {}: {}".format(index, error))
+        return errors
+
+    @classmethod
+    def bulk_create(cls, rows, chunk_size=None):
+        """
+        Insert many users, chunk_size rows per transaction with executemany.
+        :param rows: Iterable of dicts with the User.__init__ keyword arguments.
+        :return: The (index, error) of the rows that could not be inserted.
+        """
+        def insert(mappings):
+            db.session.bulk_insert_mappings(cls, mappings)
+        return cls.bulk_run(rows, cls.mapping, insert, chunk_size)
+
+    @classmethod
+    def bulk_update(cls, rows, chunk_size=None):
+        """
+        Update many users, chunk_size rows per transaction with executemany.
+        :param rows: Iterable of dicts with the 'id' of the user and the columns to change
+        ('password' is the raw password and is hashed).
+        :return: The (index, error) of the rows that could not be updated.
+        """
+        def to_mapping(row):
+            mapping = dict(row)
+            if 'id' not in mapping:
+                raise KeyError('id')
+            if 'password' in mapping:
+                mapping['password'] = passwords.hash_later(mapping['password'])
+            return mapping
+
+        def update(mappings):
+            db.session.bulk_update_mappings(cls, mappings)
+        return cls.bulk_run(rows, to_mapping, update, chunk_size)
+
+    @classmethod
+    def bulk_delete(cls, ids, chunk_size=None):
+        """
+        Delete many users by id, chunk_size ids per transaction.
+        :return: The (index, error) of the ids that could not be deleted.
+        """
+        def delete(ids):
+            ids = set(ids)
+            # The check must see the rows about to be deleted, not a replica
+            db.session().use_primary()
+            found = set(user_id for user_id, in db.session.query(cls.id).filter(cls.id.in_(ids)))
+            if found != ids:
+                raise LookupError("No user with id {}".format(", ".join(str(i) for i in sorted(ids - found))))
+            cls.query.filter(cls.id.in_(ids)).delete(synchronize_session=False)
+        return cls.bulk_run(ids, int, delete, chunk_size)
+
+    @classmethod
+    def encode_cursor(cls, value, user_id):
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        data = json.dumps([value, user_id]).encode('utf-8')
+        return base64.urlsafe_b64encode(data).decode('ascii')
+
+    @classmethod
+    def decode_cursor(cls, cursor, order_by):
+        """
+        :raise InvalidCursor: When the cursor was not made by encode_cursor for that order.
+        """
+        try:
+            value, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+            if not isinstance(user_id, int):
+                raise ValueError("user id {!r}".format(user_id))
+            if order_by == 'id':
+                if not isinstance(value, int):
+                    raise ValueError("id {!r}".format(value))
+            elif value is not None:
+                value = datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%f' if '.' in value else '%Y-%m-%dT%H:%M:%S')
+        except (TypeError, ValueError) as e:
+            raise InvalidCursor("Invalid cursor {!r}: {}".format(cursor, e))
+        return value, user_id
+
+    @classmethod
+    def after_cursor(cls, column, value, user_id, descending):
+        """
+        Condition of the rows after the cursor. NULLs sort before every value
+        (see sorted_query), so they come last in descending order.
+        """
+        if value is None:
+            if descending:
+                return db.and_(column.is_(None), cls.id < user_id)
+            return db.or_(column.isnot(None), db.and_(column.is_(None), cls.id > user_id))
+        if descending:
+            return db.or_(column < value, db.and_(column == value, cls.id < user_id), column.is_(None))
+        return db.or_(column > value, db.and_(column == value, cls.id > user_id))
+
+    @classmethod
+    def sorted_query(cls, order_by='last_login', descending=True, active=None):
+        if order_by not in cls.sort_columns:
+            raise ValueError("Users can only be sorted by {}".format(", ".join(cls.sort_columns)))
+        column = getattr(cls, order_by)
+        query = cls.query
+        if active is not None:
+            query = query.filter(cls.active == active)
+        # The id breaks ties, so the order (and every cursor) is stable. NULLs
+        # sort first as on SQLite (whose indexes are then still used), on
+        # every database.
+        if descending:
+            return query.order_by(column.desc().nulls_last(), cls.id.desc()), column
+        return query.order_by(column.asc().nulls_first(), cls.id.asc()), column
+
+    @classmethod
+    def page(cls, cursor=None, limit=50, order_by='last_login', descending=True, active=None):
+        """
+        One page of users by keyset (seek) pagination: the page starts right
+        after the row of the cursor instead of skipping OFFSET rows, so every
+        page costs the same whatever its depth.
+        :param cursor: The cursor returned with the previous page, None for the first one.
+        :raise InvalidCursor: When the cursor is not one of a previous page.
+        :return: The users of the page and the cursor of the next page (None on the last one).
+        """
+        query, column = cls.sorted_query(order_by, descending, active)
+        if cursor is not None:
+            value, user_id = cls.decode_cursor(cursor, order_by)
+            query = query.filter(cls.after_cursor(column, value, user_id, descending))
+        users = query.limit(limit + 1).all()
+        if len(users) <= limit:
+            return users, None
+        users = users[:limit]
+        last = users[-1]
+        return users, cls.encode_cursor(getattr(last, order_by), last.id)
+
+    @classmethod
+    def stream(cls, order_by='id', descending=False, active=None, batch_size=1000):
+        """
+        Iterate over every user, loading batch_size rows at a time instead of the whole table.
+        """
+        query = cls.sorted_query(order_by, descending, active)[0]
+        return query.yield_per(batch_size)
+
+    @classmethod
+    def validators(cls, user_id=None, active=None):
+        """
+        ETag and Last-Modified of a user, or of the user listing, for
+        app.conditional. They come from the id and updated_at columns (an
+        aggregate on their indexes for the listing), no row is loaded.
+        Every insert, update and delete through SQLAlchemy changes them;
+        a raw SQL update must set updated_at itself.
+        :return: (etag, last_modified), (None, None) for an unknown user.
+        """
+        if user_id is not None:
+            row = db.session.query(cls.updated_at).filter(cls.id == user_id).first()
+            if row is None:
+                return None, None
+            updated_at = row[0]
+            return 'user-{}-{}'.format(user_id, updated_at.isoformat() if updated_at else ''), updated_at
+        query = db.session.query(db.func.count(cls.id), db.func.max(cls.id), db.func.max(cls.updated_at))
+        if active is not None:
+            query = query.filter(cls.active == active)
+        count, last_id, updated_at = query.one()
+        return 'users-{}-{}-{}'.format(count, last_id or 0, updated_at.isoformat() if updated_at else ''), updated_at
+
     def is_superuser(self):
         return self.superuser
 
+    @staticmethod
+    def hash_password(password):
+        return passwords.hash(password)
+
     def set_password(self, password):
-        self.password = generate_password_hash(password)
+        self.password = self.hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password, password)
+        """
+        Verify the password on the hashing pool (see app/passwords.py).
+        A hash made under an older policy is replaced after a successful check.
+        :raise PasswordHasherBusy: When every hashing slot stayed busy.
+        """
+        if not passwords.verify(self.password, password):
+            return False
+        if passwords.needs_rehash(self.password):
+            self.set_password(password)
+            self.save()
+        return True
 
     def is_authenticated(self):
         return True
@@ -104,6 +378,16 @@ class User(db.Model):
     def get_id(self):
         return self.id
 
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'username': self.username,
+            'superuser': self.superuser,
+            'active': self.active,
+            'register_date': self.register_date.isoformat() if self.register_date else None,
+            'last_login': self.last_login.isoformat() if self.last_login else None,
+        }
+
     def __repr__(self):
         return "User(id={!r self.id}, username={!r self.username}, superuser={!r self.superuser}, " \
                "active={!r self.active}, register_date={!r self.register_date}, last_login={!r self.last_login}".format(
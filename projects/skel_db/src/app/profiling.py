@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+"""
+Per-request profiling.
+
+Every response gets a Server-Timing header with the total time of the
+request, the time spent rendering templates and, when profile_sql() is
+used, the number and time of the SQL queries. Requests slower than
+PROFILE_SLOW_MS are logged.
+
+With PROFILE_SAMPLE_RATE = N, one request in N is run under cProfile and
+its stats are written to PROFILE_DIR (open them with pstats or snakeviz).
+"""
+
+import os
+import time
+import random
+import cProfile
+import threading
+
+from flask import request, has_request_context, before_render_template, template_rendered
+
+
+ENVIRON_KEY = 'app.profiling'
+
+
+def current_stats():
+    if not has_request_context():
+        return None
+    return request.environ.get(ENVIRON_KEY)
+
+
+class ProfilingMiddleware(object):
+    def __init__(self, wsgi_app, app):
+        self.wsgi_app = wsgi_app
+        self.app = app
+        config = app.config
+        self.slow_ms = config.get('PROFILE_SLOW_MS', 500)
+        self.sample_rate = config.get('PROFILE_SAMPLE_RATE', 0)
+        self.profile_dir = config.get('PROFILE_DIR')
+        # Only one cProfile can be active at a time
+        self.profiler_lock = threading.Lock()
+
+    def sampled(self):
+        return self.sample_rate and random.randrange(self.sample_rate) == 0
+
+    def server_timing(self, stats, total):
+        metrics = ['total;dur={:.1f}'.format(total * 1e3)]
+        if stats['tpl_time']:
+            metrics.append('tpl;dur={:.1f};desc="Templates"'.format(stats['tpl_time'] * 1e3))
+        if stats['db_count']:
+            metrics.append('db;dur={:.1f};desc="{} queries"'.format(stats['db_time'] * 1e3, stats['db_count']))
+        return ', '.join(metrics)
+
+    def dump(self, profiler, environ):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = environ.get('PATH_INFO', '/').strip('/').replace('/', '.') or 'index'
+        filename = '{:.0f}-{}-{}.prof'.format(time.time() * 1e3, os.getpid(), path)
+        profiler.dump_stats(os.path.join(self.profile_dir, filename))
+
+    def __call__(self, environ, start_response):
+        stats = {'db_count': 0, 'db_time': 0.0, 'tpl_time': 0.0, 'tpl_started': []}
+        environ[ENVIRON_KEY] = stats
+        started = time.perf_counter()
+
+        def profiled_start_response(status, headers, exc_info=None):
+            headers.append(('Server-Timing', self.server_timing(stats, time.perf_counter() - started)))
+            return start_response(status, headers, exc_info)
+
+        profiler = None
+        if self.sampled() and self.profiler_lock.acquire(False):
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            return self.wsgi_app(environ, profiled_start_response)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self.profiler_lock.release()
+                self.dump(profiler, environ)
+            total_ms = (time.perf_counter() - started) * 1e3
+            if total_ms > self.slow_ms:
+                self.app.logger.warning('Slow request {} {}: {:.0f}ms, {} queries in {:.0f}ms, templates {:.0f}ms'.format(
+                    environ.get('REQUEST_METHOD'),
+                    environ.get('PATH_INFO'),
+                    total_ms,
+                    stats['db_count'],
+                    stats['db_time'] * 1e3,
+                    stats['tpl_time'] * 1e3
+                ))
+
+
+def template_started(sender, **extra):
+    stats = current_stats()
+    if stats is not None:
+        stats['tpl_started'].append(time.perf_counter())
+
+
+def template_finished(sender, **extra):
+    stats = current_stats()
+    if stats is not None and stats['tpl_started']:
+        stats['tpl_time'] += time.perf_counter() - stats['tpl_started'].pop()
+
+
+def profile_sql():
+    """
+    Count the SQL queries of every request and their time.
+    """
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def query_started(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def query_finished(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        stats = current_stats()
+        if stats is not None:
+            stats['db_count'] += 1
+            stats['db_time'] += elapsed
+
+
+def init_profiling(app):
+    if not app.config.get('PROFILE_ENABLED', True):
+        return
+    before_render_template.connect(template_started, app)
+    template_rendered.connect(template_finished, app)
+    app.wsgi_app = ProfilingMiddleware(app.wsgi_app, app)
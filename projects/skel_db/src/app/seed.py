@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""
+Synthetic data for performance tests and query plans on production-sized
+tables, used by "python manage.py seed --users 1000000".
+
+The rows come from random.Random(seed) and their dates are relative to the
+until date: the same seed and date give the same data. They are inserted
+SEED_CHUNK_SIZE rows per transaction. On SQLite the rows are plain tuples,
+with the dates as Unix times, handed to the executemany of the driver and
+formatted by SQLite itself: the per-row parameter processing of SQLAlchemy
+and Python datetimes would cost more than the inserts. Other databases get
+a Core executemany. When there are more new rows than existing ones, the
+secondary indexes are dropped during the load and built again at the end:
+one sort is much cheaper than keeping them up to date row by row.
+
+Hashing is slow by design (the default policy takes a good part of a
+second per password). With a password given, it is hashed once and every
+user gets the same hash. Otherwise every user gets its own hash, of its
+username, and the hashing sets the pace.
+"""
+
+import random
+from itertools import islice
+from datetime import datetime, timedelta
+
+from app import app, db, passwords
+from app.models import User
+
+
+FIRST_NAMES = (
+    'adam', 'alice', 'anna', 'bob', 'carlos', 'chen', 'claire', 'david', 'elena', 'emma',
+    'fatima', 'george', 'hana', 'igor', 'isabel', 'james', 'julia', 'kenji', 'laura', 'leo',
+    'maria', 'mohamed', 'nina', 'olga', 'omar', 'paul', 'priya', 'sara', 'tom', 'yuki',
+)
+LAST_NAMES = (
+    'brown', 'costa', 'dubois', 'garcia', 'ivanov', 'jones', 'kim', 'kowalski', 'lee', 'martin',
+    'meyer', 'miller', 'nguyen', 'novak', 'rossi', 'sato', 'schmidt', 'silva', 'smith', 'wang',
+)
+
+
+# Values of the rows of user_rows, in that order
+COLUMNS = ('username', 'password', 'superuser', 'active', 'register_date', 'last_login', 'updated_at')
+DATE_COLUMNS = ('register_date', 'last_login', 'updated_at')
+
+# The text format SQLAlchemy stores SQLite dates in (equal dates must compare
+# equal as text), from a Unix time
+SQLITE_DATE = "datetime(?, 'unixepoch') || '.000000'"
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def user_rows(count, rng, until, start=1, password_hash=None, days=3 * 365):
+    """
+    Tuples of the COLUMNS values, the dates as Unix times (whole seconds).
+    :param rng: The random.Random the values come from.
+    :param until: Latest registration and login date.
+    :param start: Number of the first user, part of the usernames so they stay unique.
+    :param password_hash: Hash of every user, None to hash the username of each.
+    :param days: Registrations are spread over that many days before until.
+    """
+    until = int((until - EPOCH).total_seconds())
+    period = days * 86400.0
+    names = ['{}.{}'.format(first, last) for first in FIRST_NAMES for last in LAST_NAMES]
+    random_value, choices = rng.random, len(names)
+    for number in range(start, start + count):
+        username = '{}.{}'.format(names[int(random_value() * choices)], number)
+        age = random_value() * period
+        # Most users logged in recently, some not since they registered
+        last_login = until - int(age * random_value() ** 3)
+        yield (
+            username,
+            password_hash or passwords.hash(username),
+            random_value() < 0.001,
+            random_value() < 0.9,
+            until - int(age),
+            last_login,
+            # The row last changed at the last login
+            last_login,
+        )
+
+
+def seed_users(count, seed=0, until=None, password=None, chunk_size=None):
+    """
+    Insert count synthetic users, after the existing ones.
+    :param until: Date the data is relative to (defaults to today, midnight UTC).
+    :param password: Password of every user, hashed once. None for a hash per user.
+    :return: The number of users inserted.
+    """
+    chunk_size = chunk_size or app.config.get('SEED_CHUNK_SIZE', 50000)
+    until = until or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    # The numbering follows the rows of the primary, a replica may lag
+    db.session().use_primary()
+    start = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+    password_hash = passwords.hash(password) if password is not None else None
+    rows = user_rows(count, random.Random(seed), until, start, password_hash)
+
+    table = User.__table__
+    dialect = db.session.connection().dialect
+    if dialect.name == 'sqlite':
+        quote = dialect.identifier_preparer.quote
+        statement = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            quote(table.name), ', '.join(quote(column) for column in COLUMNS),
+            ', '.join(SQLITE_DATE if column in DATE_COLUMNS else '?' for column in COLUMNS)
+        )
+
+        def insert(chunk):
+            db.session.connection().connection.cursor().executemany(statement, chunk)
+    else:
+        def insert(chunk):
+            db.session.execute(table.insert(), [
+                dict(zip(COLUMNS, row[:4] + tuple(EPOCH + timedelta(seconds=value) for value in row[4:])))
+                for row in chunk
+            ])
+
+    indexes = list(table.indexes) if count >= start else []
+    for index in indexes:
+        index.drop(db.session.connection(), checkfirst=True)
+    db.session.commit()
+
+    inserted = 0
+    try:
+        while inserted < count:
+            chunk = list(islice(rows, chunk_size))
+            try:
+                insert(chunk)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            inserted += len(chunk)
+    finally:
+        for index in indexes:
+            index.create(db.session.connection(), checkfirst=True)
+        db.session.commit()
+    return inserted
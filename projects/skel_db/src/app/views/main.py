@@ -1,7 +1,32 @@
 # -*- coding: utf-8 -*-
 
-from app import app
+from flask import abort, jsonify, request
+
+from app import app, db
+from app.cache import cached
+from app.conditional import conditional
+from app.models import User, InvalidCursor
 
 @app.route('/', methods=['GET'])
+@cached(ttl=60)
 def index():
     return "<h1>Hello World</h1>"
+
+
+@app.route('/users', methods=['GET'])
+@conditional(User.validators, weak=True)
+def users():
+    try:
+        page, cursor = User.page(cursor=request.args.get('cursor'), limit=50)
+    except InvalidCursor:
+        abort(400)
+    return jsonify(users=[user.as_dict() for user in page], next=cursor)
+
+
+@app.route('/users/<int:user_id>', methods=['GET'])
+@conditional(User.validators, weak=True)
+def user(user_id):
+    user = db.session.get(User, user_id)
+    if user is None:
+        abort(404)
+    return jsonify(user.as_dict())
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+"""
+Static asset pipeline, used by "python manage.py assets" and by the
+generator once the bower dependencies are installed.
+
+The main files of the bower packages (in dependency order) are bundled in
+vendor.js and vendor.css, the files of app/static/js and app/static/css in
+app.js and app.css. Every bundle is minified (with rjsmin and rcssmin when
+they are installed), written to app/static/dist under a content-hashed
+name, and pre-compressed to gzip (and brotli when it is installed).
+dist/manifest.json maps every bundle to its hashed file, for the
+asset_url() template helper of app/assets.py.
+
+Only the standard library is required, so the generator can run it before
+the project has a virtualenv.
+"""
+
+import os
+import re
+import glob
+import gzip
+import json
+import hashlib
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+STATIC_DIR = os.path.join(basedir, 'app', 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+# Url of STATIC_DIR, the Flask default
+STATIC_URL = '/static'
+MANIFEST_FILE = 'manifest.json'
+
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+def bower_packages(components_dir):
+    """
+    Installed bower packages, every one after its dependencies.
+    """
+    packages = {}
+    for path in glob.glob(os.path.join(components_dir, '*')):
+        for filename in ('.bower.json', 'bower.json'):
+            if os.path.exists(os.path.join(path, filename)):
+                with open(os.path.join(path, filename)) as fd:
+                    packages[os.path.basename(path)] = (path, json.load(fd))
+                break
+
+    ordered = []
+
+    def visit(name, seen):
+        if name in ordered or name not in packages or name in seen:
+            return
+        seen.add(name)
+        for dependency in sorted(packages[name][1].get('dependencies', {})):
+            visit(dependency, seen)
+        ordered.append(name)
+
+    for name in sorted(packages):
+        visit(name, set())
+    return [packages[name] for name in ordered]
+
+
+def bower_files(components_dir):
+    files = []
+    for path, package in bower_packages(components_dir):
+        main = package.get('main', [])
+        if isinstance(main, str):
+            main = [main]
+        for pattern in main:
+            files.extend(sorted(glob.glob(os.path.join(path, pattern))))
+    return files
+
+
+def bundles(static_dir):
+    vendor = bower_files(os.path.join(static_dir, 'bower_components'))
+    return {
+        'vendor.js': [path for path in vendor if path.endswith('.js')],
+        'vendor.css': [path for path in vendor if path.endswith('.css')],
+        'app.js': sorted(glob.glob(os.path.join(static_dir, 'js', '**', '*.js'), recursive=True)),
+        'app.css': sorted(glob.glob(os.path.join(static_dir, 'css', '**', '*.css'), recursive=True)),
+    }
+
+
+def rebase_css_urls(css, source, static_dir):
+    # The relative urls of a stylesheet (fonts, images) are relative to its
+    # own directory, the bundle is served from elsewhere: they become
+    # absolute urls of the static files
+    def rebase(match):
+        quote, url = match.groups()
+        if re.match(r'^([a-z]+:|/|#)', url):
+            return match.group(0)
+        path, suffix = re.match(r'^([^?#]*)(.*)$', url).groups()
+        target = os.path.normpath(os.path.join(os.path.dirname(source), path))
+        url = '{}/{}'.format(STATIC_URL, os.path.relpath(target, static_dir).replace(os.sep, '/'))
+        return 'url({0}{1}{2}{0})'.format(quote, url, suffix)
+    return CSS_URL.sub(rebase, css)
+
+
+def minify_css(css):
+    if rcssmin is not None:
+        return rcssmin.cssmin(css)
+    css = re.sub(r'/\*(?!!).*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    return re.sub(r'\s*([{};,>])\s*', r'\1', css).strip()
+
+
+def minify_js(js):
+    # Without rjsmin the scripts are only concatenated, a regex minifier is not safe for JavaScript
+    if rjsmin is not None:
+        return rjsmin.jsmin(js)
+    return js
+
+
+def build_bundle(name, sources, static_dir):
+    parts = []
+    for source in sources:
+        with open(source, encoding='utf-8') as fd:
+            content = fd.read()
+        if name.endswith('.css'):
+            content = minify_css(rebase_css_urls(content, source, static_dir))
+        else:
+            # A script may not end with a semicolon
+            content = minify_js(content).rstrip() + '\n;'
+        parts.append(content)
+    return '\n'.join(parts).encode('utf-8')
+
+
+def hashed_name(name, data):
+    root, ext = os.path.splitext(name)
+    return '{}.{}{}'.format(root, hashlib.sha256(data).hexdigest()[:12], ext)
+
+
+def precompress(path, data):
+    variants = [('.gz', gzip.compress(data, 9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(data, quality=11)))
+    for ext, compressed in variants:
+        # Small files can grow when compressed
+        if len(compressed) < len(data):
+            with open(path + ext, 'wb') as fd:
+                fd.write(compressed)
+
+
+def build(static_dir=STATIC_DIR, output_dir=DIST_DIR):
+    """
+    :return: The manifest, the hashed file of every bundle.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {}
+    for name, sources in sorted(bundles(static_dir).items()):
+        if not sources:
+            continue
+        data = build_bundle(name, sources, static_dir)
+        filename = hashed_name(name, data)
+        path = os.path.join(output_dir, filename)
+        if not os.path.exists(path):
+            with open(path, 'wb') as fd:
+                fd.write(data)
+            precompress(path, data)
+        manifest[name] = filename
+
+    # Files of the previous builds are not referenced anymore
+    current = set(manifest.values())
+    for filename in os.listdir(output_dir):
+        if filename != MANIFEST_FILE and re.sub(r'\.(gz|br)$', '', filename) not in current:
+            os.remove(os.path.join(output_dir, filename))
+
+    with open(os.path.join(output_dir, MANIFEST_FILE), 'w') as fd:
+        json.dump(manifest, fd, indent=2, sort_keys=True)
+    return manifest
+
+
+if __name__ == '__main__':
+    for name, filename in sorted(build().items()):
+        print("{:<12} {}".format(name, filename))
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+
+"""
+Load generator, used by "python manage.py loadtest". Only the standard
+library is needed.
+
+    python manage.py serve
+    python manage.py loadtest -c 50 -d 30 -p /:90 -p /metrics:10 -o before.json
+    python manage.py loadtest -c 50 -d 30 -p /:90 -p /metrics:10 --compare before.json
+
+Every connection is a thread with a keep-alive HTTP connection, sending the
+requests of the mix (path:weight, "POST /path:weight" for other methods).
+Without --rate every connection sends its next request as soon as it got
+the previous response (closed loop). With --rate the requests are sent on
+a fixed schedule, and their latency counts from the moment they should
+have been sent: a server that falls behind can not hide its queueing
+(coordinated omission).
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+import http.client
+from datetime import datetime
+from urllib.parse import urlsplit
+
+
+def parse_mix(specs):
+    """
+    :param specs: "path", "path:weight" or "METHOD path:weight" strings.
+    :return: The (method, path) requests and their weights.
+    """
+    requests, weights = [], []
+    for spec in specs or ['/']:
+        weight = 1.0
+        head, sep, tail = spec.rpartition(':')
+        if sep and tail.replace('.', '', 1).isdigit():
+            spec, weight = head, float(tail)
+        method, _, path = spec.strip().rpartition(' ')
+        requests.append((method.upper() or 'GET', path))
+        weights.append(weight)
+    return requests, weights
+
+
+def percentile(values, rank):
+    # Nearest rank, values are sorted
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(round(rank / 100.0 * len(values) + 0.5)) - 1))]
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    return {
+        'count': len(latencies),
+        'mean': sum(latencies) / len(latencies) if latencies else 0.0,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'max': latencies[-1] if latencies else 0.0,
+    }
+
+
+class Schedule(object):
+    """
+    Send times of an open loop at rate requests per second, shared by the
+    connections.
+    """
+
+    def __init__(self, rate, started):
+        self.interval = 1.0 / rate
+        self.started = started
+        self.sent = 0
+        self.lock = threading.Lock()
+
+    def next(self):
+        with self.lock:
+            moment = self.started + self.sent * self.interval
+            self.sent += 1
+        delay = moment - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        return moment
+
+
+class LoadTest(object):
+    def __init__(self, url, mix, connections=10, duration=10.0, requests=None, rate=None,
+                 timeout=10.0, headers=None, seed=0):
+        parts = urlsplit(url)
+        self.scheme = parts.scheme or 'http'
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port
+        self.prefix = parts.path.rstrip('/')
+        self.url = url
+        self.mix, self.weights = parse_mix(mix)
+        self.connections = connections
+        self.duration = duration
+        self.requests = requests
+        self.rate = rate
+        self.timeout = timeout
+        self.headers = dict(headers or {})
+        self.seed = seed
+
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.latencies = {}
+        self.statuses = {}
+        self.errors = {}
+
+    def connect(self):
+        connection_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        return connection_class(self.host, self.port, timeout=self.timeout)
+
+    def take(self):
+        # Whether another request may be sent, under the requests limit
+        with self.lock:
+            if self.requests is not None and self.sent >= self.requests:
+                return False
+            self.sent += 1
+            return True
+
+    def record(self, request, latency, status=None, error=None):
+        with self.lock:
+            if error is not None:
+                self.errors[error] = self.errors.get(error, 0) + 1
+                return
+            self.latencies.setdefault(request, []).append(latency)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def worker(self, index, deadline, schedule):
+        rng = random.Random(self.seed + index)
+        connection = self.connect()
+        try:
+            while time.perf_counter() < deadline and self.take():
+                request = rng.choices(self.mix, self.weights)[0]
+                method, path = request
+                started = schedule.next() if schedule else time.perf_counter()
+                try:
+                    connection.request(method, self.prefix + path, headers=self.headers)
+                    response = connection.getresponse()
+                    response.read()
+                except (OSError, http.client.HTTPException) as e:
+                    self.record(request, None, error=type(e).__name__)
+                    connection.close()
+                    connection = self.connect()
+                    continue
+                self.record(request, time.perf_counter() - started, status=response.status)
+        finally:
+            connection.close()
+
+    def run(self):
+        started = time.perf_counter()
+        deadline = started + self.duration if self.duration else float('inf')
+        schedule = Schedule(self.rate, started) if self.rate else None
+        threads = [
+            threading.Thread(target=self.worker, args=(index, deadline, schedule), daemon=True)
+            for index in range(self.connections)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.result(time.perf_counter() - started)
+
+    def result(self, elapsed):
+        every = [latency for latencies in self.latencies.values() for latency in latencies]
+        return {
+            'url': self.url,
+            'commit': current_commit(),
+            'date': datetime.utcnow().isoformat(),
+            'connections': self.connections,
+            'rate': self.rate,
+            'seed': self.seed,
+            'elapsed': elapsed,
+            'requests': len(every),
+            'errors': sum(self.errors.values()),
+            'error_types': self.errors,
+            'throughput': len(every) / elapsed if elapsed else 0.0,
+            'statuses': dict((str(status), count) for status, count in sorted(self.statuses.items())),
+            'latency': summarize(every),
+            'paths': dict(
+                ('{} {}'.format(method, path), summarize(latencies))
+                for (method, path), latencies in sorted(self.latencies.items())
+            ),
+        }
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL
+        ).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_result(result, out=sys.stdout):
+    print("{requests} requests in {elapsed:.1f}s over {connections} connections, {errors} errors".format(**result), file=out)
+    print("Throughput: {:.1f} req/s".format(result['throughput']), file=out)
+    print("Statuses:   {}".format(", ".join("{}: {}".format(*item) for item in result['statuses'].items())), file=out)
+    print("{:<24} {:>8} {:>9} {:>9} {:>9} {:>9}".format("Latency", "Count", "p50", "p95", "p99", "Max"), file=out)
+    rows = [('all', result['latency'])] + sorted(result['paths'].items())
+    for name, latency in rows:
+        print("{:<24} {:>8} {:>7.1f}ms {:>7.1f}ms {:>7.1f}ms {:>7.1f}ms".format(
+            name[:24], latency['count'], latency['p50'] * 1e3, latency['p95'] * 1e3,
+            latency['p99'] * 1e3, latency['max'] * 1e3
+        ), file=out)
+
+
+def print_comparison(result, baseline, out=sys.stdout):
+    def change(new, old):
+        return "{:+.1%}".format(new / old - 1) if old else "-"
+
+    print("Against {} ({}):".format(baseline.get('commit') or 'baseline', baseline.get('date', '')), file=out)
+    print("  Throughput {:>10.1f} req/s {:>8}".format(
+        result['throughput'], change(result['throughput'], baseline['throughput'])
+    ), file=out)
+    for rank in ('p50', 'p95', 'p99'):
+        print("  {:<10} {:>10.1f}ms    {:>8}".format(
+            rank, result['latency'][rank] * 1e3, change(result['latency'][rank], baseline['latency'][rank])
+        ), file=out)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='loadtest', description='Measure the throughput and latency of the app.')
+    parser.add_argument('-u', '--url', default='http://127.0.0.1:8000', help='Base url of the running app')
+    parser.add_argument('-p', '--path', action='append', dest='mix', metavar='PATH[:WEIGHT]',
+                        help='Request of the mix, "POST /path" for another method, repeat for several (default: /)')
+    parser.add_argument('-c', '--connections', type=int, default=10, help='Concurrent connections')
+    parser.add_argument('-d', '--duration', type=float, default=10.0, help='Seconds to run')
+    parser.add_argument('-n', '--requests', type=int, help='Stop after this many requests')
+    parser.add_argument('-r', '--rate', type=float, help='Requests per second for all connections (open loop)')
+    parser.add_argument('-H', '--header', action='append', default=[], metavar='NAME:VALUE', help='Request header')
+    parser.add_argument('-t', '--timeout', type=float, default=10.0, help='Seconds before a request fails')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the request mix')
+    parser.add_argument('-o', '--output', help='Write the result as JSON to this file')
+    parser.add_argument('--compare', metavar='FILE', help='JSON result of an earlier run to compare with')
+    args = parser.parse_args(argv)
+
+    headers = dict(header.split(':', 1) for header in args.header)
+    headers = dict((name.strip(), value.strip()) for name, value in headers.items())
+    result = LoadTest(
+        args.url, args.mix, args.connections, args.duration, args.requests, args.rate,
+        args.timeout, headers, args.seed
+    ).run()
+    print_result(result)
+
+    if args.compare:
+        with open(args.compare) as fd:
+            print_comparison(result, json.load(fd))
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump(result, fd, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,14 +1,78 @@
 # -*- coding: utf-8 -*-
 
-from flask_script import Manager
+import os
+import sys
+import time
+from datetime import datetime
 
+import click
+
+import build_assets
+import loadtest as loadtest_module
 from app import app, db
+from app.database import sync_replicas as copy_replicas
+from app.seed import seed_users
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+
+@click.group()
+@click.pass_context
+def manager(context):
+    # Every command runs in an application context (db.session, current_app)
+    context.with_resource(app.app_context())
+
+@manager.command()
+@click.option('--host', default='127.0.0.1')
+@click.option('--port', default=5000)
+def runserver(host, port):
+    """Run the development server"""
+    app.run(host=host, port=port, debug=app.config.get('DEBUG', False))
 
-manager = Manager(app)
+@manager.command()
+def assets():
+    """Bundle, minify, hash and pre-compress the static files (see build_assets.py)"""
+    for name, filename in sorted(build_assets.build().items()):
+        print("{:<12} {}".format(name, filename))
 
-@manager.command
+@manager.command()
+def serve():
+    """Run the app under Gunicorn with the production profile of gunicorn_config.py"""
+    os.chdir(basedir)
+    os.execv(sys.executable, [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn_config.py', 'wsgi:application'])
+
+@manager.command('create_db')
 def create_db():
     db.create_all()
+    if app.config.get('DB_REPLICAS'):
+        sync_replicas.callback()
+
+@manager.command('sync_replicas')
+def sync_replicas():
+    """Copy the SQLite primary database over its SQLite replicas (DB_REPLICAS)"""
+    for filename in copy_replicas(db):
+        print("Copied to {}".format(filename))
+
+@manager.command()
+@click.option('-u', '--users', type=int, default=1000, help='Number of users to add')
+@click.option('-s', '--seed', type=int, default=0, help='Seed of the random generator')
+@click.option('-p', '--password', default=None,
+              help='Password of every user, hashed once (otherwise one hash per user, much slower)')
+@click.option('--until', default=None, help='Date (YYYY-MM-DD) the data is relative to, today by default')
+@click.option('--chunk-size', type=int, default=None, help='Rows per transaction')
+def seed(users, seed, password, until, chunk_size):
+    """Fill the database with synthetic users (see app/seed.py)"""
+    until = datetime.strptime(until, '%Y-%m-%d') if until else None
+    started = time.perf_counter()
+    count = seed_users(users, seed, until, password, chunk_size)
+    elapsed = time.perf_counter() - started
+    print("{} users in {:.1f}s ({:.0f} rows/s)".format(count, elapsed, count / elapsed if elapsed else 0))
+
+@manager.command(context_settings={'ignore_unknown_options': True, 'help_option_names': []})
+@click.argument('args', nargs=-1, type=click.UNPROCESSED)
+def loadtest(args):
+    """Measure throughput and latency of the running app (options: python loadtest.py -h)"""
+    loadtest_module.main(list(args))
 
 if __name__ == "__main__":
-    manager.run()
+    manager()
@@ -0,0 +1,195 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+import instrumentation
+from utils import colors
+from external import External, Bower, Git, Virtualenv
+from project.flask import FlaskProject, FlaskDbProject, FlaskAsyncProject
+from scheduler import Scheduler
+from template import get_environment, generate_errorlist
+
+
+SPEC_DEFAULTS = {
+    'database': False,
+    'async': False,
+    'git': False,
+    'virtualenv': False,
+    'bower': [],
+    'debug': True,
+    'db_profile': 'dev',
+}
+
+
+def load_manifest(filename):
+    """
+    Read the project specs from a JSON or TOML manifest.
+
+    The manifest is either a list of specs or a table with a "projects" list
+    and optional "path" and "workers" defaults.
+    """
+    if filename.endswith('.toml'):
+        try:
+            import tomllib
+        except ImportError:
+            raise SystemExit("TOML manifests need Python 3.11 or newer, use JSON instead.")
+        with open(filename, 'rb') as fd:
+            manifest = tomllib.load(fd)
+    else:
+        with open(filename) as fd:
+            manifest = json.load(fd)
+
+    if isinstance(manifest, list):
+        manifest = {'projects': manifest}
+    specs = []
+    for spec in manifest.get('projects', []):
+        if 'appname' not in spec:
+            raise SystemExit("Every project in {} needs an appname.".format(filename))
+        spec = dict(SPEC_DEFAULTS, **spec)
+        if isinstance(spec['bower'], str):
+            spec['bower'] = [dependency for dependency in spec['bower'].split(',') if dependency]
+        specs.append(spec)
+    return manifest, specs
+
+
+def make_project(spec, path):
+    if spec['async']:
+        project_class = FlaskAsyncProject
+    elif spec['database']:
+        project_class = FlaskDbProject
+    else:
+        project_class = FlaskProject
+    return project_class(
+        spec['appname'],
+        apppath=spec.get('path', path),
+        debug=spec['debug'],
+        git=spec['git'],
+        virtualenv=spec['virtualenv'],
+        bower=spec['bower'],
+        db_profile=spec['db_profile'],
+    )
+
+
+def discover_tools(projects):
+    # External.cmd is resolved once here and handed to every worker
+    tools = [Git]
+    if any(project.bower for project in projects):
+        tools.append(Bower)
+    if any(project.virtualenv for project in projects):
+        tools.append(Virtualenv)
+    return {tool.__name__: tool.cmd() for tool in tools}
+
+
+def load_templates(projects):
+    for tpl_path in {project.tpl_path() for project in projects}:
+        env = get_environment(tpl_path)
+        for name in env.list_templates(extensions=['jinja2']):
+            env.get_template(name)
+
+
+def prepare_venvs(projects):
+    scheduler = Scheduler()
+    for requirements_file in {project.skeleton_requirements_file for project in projects if project.virtualenv}:
+        scheduler.add(requirements_file, Virtualenv.prepare, requirements_file)
+    scheduler.run()
+
+
+def init_worker(tools):
+    for tool in (Git, Bower, Virtualenv):
+        if tool.__name__ in tools:
+            tool._util = tools[tool.__name__]
+
+
+def generate(spec, path):
+    """
+    Generate one project in a worker process.
+
+    The progress output is captured so the workers do not interleave; only
+    its last line is kept to explain a failure.
+    """
+    started = time.perf_counter()
+    output = io.StringIO()
+    error = None
+    instrumentation.recorder.clear()
+    try:
+        with contextlib.redirect_stdout(output):
+            make_project(spec, path).install()
+    except SystemExit as e:
+        # External tools explain the failure in the captured output before exiting
+        lines = [line for line in output.getvalue().splitlines() if "Please consult" in line]
+        error = lines[-1] if lines else "Exited with status {}".format(e.code)
+    except Exception as e:
+        error = str(e) or e.__class__.__name__
+    return {
+        'appname': spec['appname'],
+        'time': time.perf_counter() - started,
+        'error': error,
+        'steps': instrumentation.recorder.as_dicts(),
+    }
+
+
+def print_summary(results, total):
+    width = max([len("Project")] + [len(result['appname']) for result in results])
+    print("{:<{width}}  {:<6}  {:>8}".format("Project", "Status", "Time", width=width))
+    for result in results:
+        if result['error']:
+            status = "{red}Failed{end}".format(red=colors.FAIL, end=colors.ENDC)
+        else:
+            status = "{green}Ok{end}    ".format(green=colors.OKGREEN, end=colors.ENDC)
+        line = "{:<{width}}  {}  {:>7.2f}s".format(result['appname'], status, result['time'], width=width)
+        if result['error']:
+            line += "  {}".format(result['error'])
+        print(line)
+    failed = len([result for result in results if result['error']])
+    print("{} projects, {} failed, {:.2f}s".format(len(results), failed, total))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Create many skeleton applications from a JSON/TOML manifest.')
+    parser.add_argument('manifest', help='The manifest with the project specs')
+    parser.add_argument('-j', '--jobs', type=int, help='Number of worker processes')
+    parser.add_argument('-p', '--path', help='Directory the projects are generated in')
+    parser.add_argument('--trace', metavar='FILE', help='Write the timings of every step to FILE')
+    parser.add_argument('--trace-format', choices=sorted(instrumentation.TRACE_FORMATS), default='chrome',
+                        help='Chrome trace_event format (chrome://tracing, Perfetto) or plain JSON')
+    args = parser.parse_args(argv[1:])
+
+    manifest, specs = load_manifest(args.manifest)
+    path = args.path or manifest.get('path', 'temp')
+    jobs = args.jobs or manifest.get('workers') or os.cpu_count()
+
+    started = time.perf_counter()
+    projects = [make_project(spec, path) for spec in specs]
+
+    # Shared work is done once per batch, not once per project
+    tools = discover_tools(projects)
+    errors = External.errors
+    if len(errors) > 0:
+        print(generate_errorlist({'errors': errors, }))
+        sys.exit(1)
+    load_templates(projects)
+    prepare_venvs(projects)
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(tools,)) as executor:
+        results = list(executor.map(generate, specs, [path] * len(specs)))
+
+    print_summary(results, time.perf_counter() - started)
+    if args.trace:
+        steps = instrumentation.recorder.as_dicts()
+        for result in results:
+            steps.extend(result['steps'])
+        instrumentation.export(args.trace, steps, args.trace_format)
+    if any(result['error'] for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
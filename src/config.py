@@ -5,6 +5,16 @@ LOG_VIRTUALENV = "virtualenv-error.log"
 LOG_PIP = "pip-error.log"
 LOG_BOWER = "bower-error.log"
 LOG_GIT = "git-error.log"
+LOG_ASSETS = "assets-error.log"
+# Lines of output kept in memory to report a failed command
+LOG_TAIL = 20
+
+# Seconds an external command may run before it is killed
+TIMEOUT_VIRTUALENV = 300
+TIMEOUT_PIP = 900
+TIMEOUT_BOWER = 300
+TIMEOUT_GIT = 60
+TIMEOUT_ASSETS = 120
 
 TPL_BRIEF = "brief.jinja2"
 TPL_ERRORS = "errors.jinja2"
@@ -13,3 +23,11 @@ SRC_DIR = os.path.dirname(os.path.realpath(__file__))
 BASE_DIR = os.path.abspath(os.path.join(SRC_DIR, ".."))
 SCRIPT_DIR = os.path.join(BASE_DIR, "projects")
 TEMPLATE_DIR = os.path.join(BASE_DIR, "templates")
+
+CACHE_DIR = os.environ.get(
+    "FLASK_SKELETON_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "flask-skeleton")
+)
+VENV_CACHE_DIR = os.path.join(CACHE_DIR, "venvs")
+TEMPLATE_CACHE_DIR = os.path.join(CACHE_DIR, "jinja2")
+TOOLS_CACHE_FILE = os.path.join(CACHE_DIR, "tools.json")
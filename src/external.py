@@ -1,21 +1,35 @@
 import os
 import sys
+import json
 import shutil
+import time
+import hashlib
+import platform
+import threading
 import subprocess
+from collections import deque
 
 
 import config
 
 
 from utils import colors
-from template import next_step
+from template import next_step, output_lock
+from instrumentation import recorder
+
+
+# Set to stop every running external command, e.g. once a step failed
+cancelled = threading.Event()
+
+
+def cancel():
+    cancelled.set()
 
 
 def log_error(logfile='error.log', error="", msg="", exit_on_error=True):
     if not error:
         return
-    with open(logfile, 'w') as fd:
-        fd.write(error.decode('utf-8'))
+    with output_lock:
         print("{red}{msg} Please consult {yellow}{logfile}{red} file for details.{end}".format(
             msg=msg,
             logfile=logfile,
@@ -23,22 +37,116 @@ def log_error(logfile='error.log', error="", msg="", exit_on_error=True):
             yellow=colors.WARNING,
             end=colors.ENDC
         ))
-        if exit_on_error:
-            sys.exit(2)
+        print(error, end="", flush=True)
+    if exit_on_error:
+        sys.exit(2)
+
+
+def tee(pipe, log_fd, tail):
+    # One write per line on an O_APPEND file, so concurrent runs sharing a log do not mix lines
+    for line in iter(pipe.readline, b''):
+        log_fd.write(line)
+        tail.append(line)
+    pipe.close()
+
+
+def run(params, logfile, msg, exit_on_error=True, cwd=None, timeout=None, tail_lines=config.LOG_TAIL):
+    """
+    Run an external command, streaming its output line by line to logfile.
+
+    Only the last tail_lines lines are kept in memory for the error report.
+    The command fails on a non-zero exit code, when it runs longer than
+    timeout seconds, or when cancel() is called.
+    """
+    tail = deque(maxlen=tail_lines)
+    started = time.perf_counter()
+    with open(logfile, 'ab', buffering=0) as log_fd:
+        log_fd.write("$ {}\n".format(" ".join(params)).encode('utf-8'))
+        process = subprocess.Popen(
+            params,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=cwd
+        )
+        readers = [
+            threading.Thread(target=tee, args=(pipe, log_fd, tail), daemon=True)
+            for pipe in (process.stdout, process.stderr)
+        ]
+        for reader in readers:
+            reader.start()
+
+        deadline = time.monotonic() + timeout if timeout else None
+        reason = None
+        while reason is None:
+            try:
+                process.wait(timeout=0.1)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            if cancelled.is_set():
+                reason = "Cancelled."
+            elif deadline is not None and time.monotonic() > deadline:
+                reason = "Timed out after {} seconds.".format(timeout)
+        if reason is not None:
+            process.kill()
+            process.wait()
 
+        for reader in readers:
+            reader.join()
+        if reason is None and process.returncode != 0:
+            reason = "Exited with status {}.".format(process.returncode)
+        if reason is not None:
+            log_fd.write("# {}\n".format(reason).encode('utf-8'))
+    recorder.add_subprocess_time(time.perf_counter() - started)
 
-def run(params, logfile, msg, exit_on_error=True):
-    output, error = subprocess.Popen(
-        params,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    ).communicate()
-    log_error(
-        logfile,
-        error,
-        msg,
-        exit_on_error
-    )
+    if reason is None:
+        return True
+    error = b"".join(tail).decode('utf-8', 'replace') + reason + "\n"
+    log_error(logfile, error, msg, exit_on_error)
+    return False
+
+
+def load_tools_cache():
+    try:
+        with open(config.TOOLS_CACHE_FILE) as fd:
+            return json.load(fd)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_tools_cache(tools):
+    try:
+        os.makedirs(os.path.dirname(config.TOOLS_CACHE_FILE), exist_ok=True)
+        tmp_file = "{}.tmp-{}".format(config.TOOLS_CACHE_FILE, os.getpid())
+        with open(tmp_file, 'w') as fd:
+            json.dump(tools, fd)
+        os.replace(tmp_file, config.TOOLS_CACHE_FILE)
+    except OSError:
+        pass
+
+
+def which(cmd_name):
+    """
+    shutil.which with an on-disk cache, scanning PATH is slow on network homes.
+
+    An entry is only used while PATH is the same and the executable still
+    has the mtime it had when it was found.
+    """
+    path_env = os.environ.get('PATH', '')
+    tools = load_tools_cache()
+    cached = tools.get(cmd_name)
+    if cached and cached['PATH'] == path_env:
+        try:
+            if os.stat(cached['path']).st_mtime == cached['mtime']:
+                return cached['path']
+        except OSError:
+            pass
+
+    path = shutil.which(cmd_name)
+    if path:
+        tools[cmd_name] = {'path': path, 'PATH': path_env, 'mtime': os.stat(path).st_mtime}
+        save_tools_cache(tools)
+    return path
 
 
 class External():
@@ -50,7 +158,7 @@ class External():
     @classmethod
     def cmd(cls):
         if cls._util is None:
-            cls._util = shutil.which(cls.cmd_name)
+            cls._util = which(cls.cmd_name)
         if not cls._util:
             cls.errors.append(cls.error_msg)
         return cls._util
@@ -61,29 +169,44 @@ class Bower(External):
     error_msg = 'Bower executable could not be found.'
 
     @classmethod
+    @next_step("Bower packages...\t\t\t")
     def install(cls, static_dir, dependencies):
-        os.chdir(static_dir)
-        for dependency in dependencies:
-            cls.install_dependency(dependency)
-
-    @classmethod
-    @next_step("Bower")
-    def install_dependency(cls, dependency):
-        print("{}...\t\t\t".format(dependency.title()), end="", flush=True)
+        # One bower process for every package: separate ones running at the
+        # same time would race on the packages they share (bootstrap pulls
+        # jquery) in bower_components/ and on the bower cache. The step still
+        # overlaps with git and virtualenv.
+        os.makedirs(static_dir, exist_ok=True)
         run(
-            [cls.cmd(), 'install', dependency],
+            [cls.cmd(), 'install'] + list(dependencies),
             config.LOG_BOWER,
-            "An error occured during the installation of {dep}.".format(
-                dep=dependency
+            "An error occured during the installation of {deps}.".format(
+                deps=", ".join(dependencies)
             ),
-            False
+            False,
+            cwd=static_dir,
+            timeout=config.TIMEOUT_BOWER
         )
 
 
+def link_or_copy(src, dst):
+    # Hardlink where possible, the cache and the clone share the same disk blocks
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+        recorder.add_bytes(os.path.getsize(dst))
+    return dst
+
+
 class Virtualenv(External):
     cmd_name = "virtualenv"
     error_msg = 'Virtualenv executable could not be found.'
 
+    cache_dir = config.VENV_CACHE_DIR
+    marker_file = '.skeleton-venv.json'
+    _cache_locks = {}
+    _cache_locks_lock = threading.Lock()
+
     @classmethod
     def venv_bin_dir(cls, venv_path):
         return os.path.join(venv_path, 'bin')
@@ -93,18 +216,127 @@ class Virtualenv(External):
         return os.path.join(cls.venv_bin_dir(venv_path), 'pip')
 
     @classmethod
-    def install(cls, venv_path, requirements_file):
-        cls.install_venv(venv_path)
-        cls.install_dependencies(venv_path, requirements_file)
+    def install(cls, venv_path, requirements_file, use_cache=True):
+        if use_cache:
+            cls.clone(cls.prepare(requirements_file), venv_path)
+        else:
+            cls.install_venv(venv_path)
+            cls.install_dependencies(venv_path, requirements_file)
+
+    @classmethod
+    def cache_key(cls, requirements_file):
+        # The environments are built with the interpreter of the generator (install_venv)
+        digest = hashlib.sha256()
+        digest.update(sys.executable.encode('utf-8'))
+        digest.update(platform.python_implementation().encode('utf-8'))
+        digest.update(platform.python_version().encode('utf-8'))
+        with open(requirements_file, 'rb') as fd:
+            digest.update(fd.read())
+        return digest.hexdigest()[:24]
+
+    @classmethod
+    def cached_venv(cls, key):
+        return os.path.join(cls.cache_dir, key)
+
+    @classmethod
+    def read_marker(cls, venv_path):
+        try:
+            with open(os.path.join(venv_path, cls.marker_file)) as fd:
+                return json.load(fd)
+        except (OSError, ValueError):
+            return None
+
+    @classmethod
+    def write_marker(cls, venv_path, key):
+        marker = os.path.join(venv_path, cls.marker_file)
+        if os.path.exists(marker):
+            # Never write through a hardlink into the cache
+            os.unlink(marker)
+        with open(marker, 'w') as fd:
+            json.dump({'key': key, 'origin': venv_path}, fd)
+
+    @classmethod
+    def _cache_lock(cls, key):
+        with cls._cache_locks_lock:
+            return cls._cache_locks.setdefault(key, threading.Lock())
+
+    @classmethod
+    def prepare(cls, requirements_file):
+        """
+        Return the path of a ready-made virtualenv for requirements_file,
+        building it into the cache on a miss.
+
+        The cache is keyed by the requirements and the interpreter, so a hit
+        needs neither the network nor pip.
+        """
+        key = cls.cache_key(requirements_file)
+        cached = cls.cached_venv(key)
+        with cls._cache_lock(key):
+            if cls.read_marker(cached):
+                return cached
+
+            os.makedirs(cls.cache_dir, exist_ok=True)
+            build_path = "{}.build-{}-{}".format(cached, os.getpid(), threading.get_ident())
+            try:
+                cls.install_venv(build_path)
+                cls.install_dependencies(build_path, requirements_file)
+                cls.write_marker(build_path, key)
+                try:
+                    os.rename(build_path, cached)
+                except OSError:
+                    # Another process finished the same environment first
+                    if not cls.read_marker(cached):
+                        raise
+                    shutil.rmtree(build_path, ignore_errors=True)
+            except BaseException:
+                shutil.rmtree(build_path, ignore_errors=True)
+                raise
+        return cached
+
+    @classmethod
+    @next_step("Cloning the virtualenv...\t")
+    def clone(cls, cached, venv_path):
+        marker = cls.read_marker(cached)
+        current = cls.read_marker(venv_path)
+        if current and current['key'] == marker['key']:
+            # Regenerating a project with unchanged requirements
+            return
+        if os.path.exists(venv_path):
+            shutil.rmtree(venv_path)
+        shutil.copytree(cached, venv_path, symlinks=True, copy_function=link_or_copy)
+        cls.relocate(venv_path, marker['origin'])
+        cls.write_marker(venv_path, marker['key'])
+
+    @classmethod
+    def relocate(cls, venv_path, origin):
+        # Scripts and activate files carry the absolute path of the venv they were built in
+        old = origin.encode('utf-8')
+        new = venv_path.encode('utf-8')
+        bin_dir = cls.venv_bin_dir(venv_path)
+        for filename in os.listdir(bin_dir):
+            path = os.path.join(bin_dir, filename)
+            if os.path.islink(path) or not os.path.isfile(path):
+                continue
+            with open(path, 'rb') as fd:
+                content = fd.read()
+            if old not in content:
+                continue
+            mode = os.stat(path).st_mode
+            os.unlink(path)
+            with open(path, 'wb') as fd:
+                fd.write(content.replace(old, new))
+            os.chmod(path, mode)
 
     @classmethod
     @next_step("Creating the virtualenv...\t")
     def install_venv(cls, venv_path):
-        # If virtualenv is requested, then create it and install the required libs to work
+        # If virtualenv is requested, then create it and install the required libs to work.
+        # The interpreter is the one of the generator, the one cache_key names.
         run(
-            [cls.cmd(), venv_path, '--no-site-package'],
+            [cls.cmd(), '-p', sys.executable, venv_path],
             config.LOG_VIRTUALENV,
-            "An error occured during the creation of the virtualenv."
+            "An error occured during the creation of the virtualenv.",
+            timeout=config.TIMEOUT_VIRTUALENV
         )
 
     @classmethod
@@ -114,6 +346,7 @@ class Virtualenv(External):
             [cls.pip_bin(venv_path), 'install', '-r', requirements_file],
             config.LOG_PIP,
             "An error occured during the installation of dependencies.",
+            timeout=config.TIMEOUT_PIP
         )
 
 
@@ -132,7 +365,8 @@ class Git(External):
         run(
             [cls.cmd(), 'init', app_path],
             config.LOG_GIT,
-            "An error occured during the creation of the virtualenv."
+            "An error occured during the creation of the git repository.",
+            timeout=config.TIMEOUT_GIT
         )
 
     @classmethod
@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import threading
+import contextlib
+
+
+class StepRecord():
+    def __init__(self, name):
+        self.name = name
+        self.pid = os.getpid()
+        self.tid = threading.get_ident()
+        self.start = time.time()
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.bytes_written = 0
+        self.subprocess_time = 0.0
+        self.status = "running"
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'pid': self.pid,
+            'tid': self.tid,
+            'start': self.start,
+            'wall': self.wall,
+            'cpu': self.cpu,
+            'bytes_written': self.bytes_written,
+            'subprocess_time': self.subprocess_time,
+            'status': self.status,
+        }
+
+
+class Recorder():
+    """
+    Collects the wall time, CPU time, bytes written and subprocess time of
+    every generator step.
+
+    Steps run on several threads, the step a thread is inside of is kept
+    in a thread-local stack so writes and commands are charged to it.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    @property
+    def current(self):
+        stack = self.stack()
+        return stack[-1] if stack else None
+
+    @contextlib.contextmanager
+    def step(self, name):
+        record = StepRecord(name)
+        self.stack().append(record)
+        wall_started = time.perf_counter()
+        cpu_started = time.thread_time()
+        try:
+            yield record
+            record.status = "ok"
+        except BaseException:
+            record.status = "failed"
+            raise
+        finally:
+            record.wall = time.perf_counter() - wall_started
+            record.cpu = time.thread_time() - cpu_started
+            self.stack().pop()
+            with self.lock:
+                self.records.append(record)
+
+    def add_bytes(self, count):
+        record = self.current
+        if record is not None:
+            record.bytes_written += count
+
+    def add_subprocess_time(self, seconds):
+        record = self.current
+        if record is not None:
+            record.subprocess_time += seconds
+
+    def as_dicts(self):
+        with self.lock:
+            return [record.as_dict() for record in self.records]
+
+    def clear(self):
+        with self.lock:
+            self.records = []
+
+
+def to_json(records):
+    return {
+        'steps': records,
+        'wall': sum(record['wall'] for record in records),
+        'cpu': sum(record['cpu'] for record in records),
+        'bytes_written': sum(record['bytes_written'] for record in records),
+        'subprocess_time': sum(record['subprocess_time'] for record in records),
+    }
+
+
+def to_chrome_trace(records):
+    # Complete ("X") events, see the Trace Event Format document
+    events = []
+    for record in records:
+        events.append({
+            'name': record['name'],
+            'cat': 'step',
+            'ph': 'X',
+            'ts': int(record['start'] * 1e6),
+            'dur': int(record['wall'] * 1e6),
+            'pid': record['pid'],
+            'tid': record['tid'],
+            'args': {
+                'cpu_ms': round(record['cpu'] * 1e3, 3),
+                'subprocess_ms': round(record['subprocess_time'] * 1e3, 3),
+                'bytes_written': record['bytes_written'],
+                'status': record['status'],
+            },
+        })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+TRACE_FORMATS = {
+    'chrome': to_chrome_trace,
+    'json': to_json,
+}
+
+
+def export(filename, records, fmt='chrome'):
+    with open(filename, 'w') as fd:
+        json.dump(TRACE_FORMATS[fmt](records), fd, indent=1)
+
+
+recorder = Recorder()
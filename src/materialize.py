@@ -0,0 +1,290 @@
+import io
+import os
+import json
+import stat
+import time
+import shutil
+import hashlib
+import tarfile
+import zipfile
+import threading
+
+from instrumentation import recorder
+
+
+MANIFEST_FILE = '.skeleton-manifest.json'
+
+# ioctl(2) request to share the extents of a file (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fd:
+        for chunk in iter(lambda: fd.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_read_only(path):
+    return not os.stat(path).st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+
+
+def reflink(src, dst):
+    import fcntl
+    with open(src, 'rb') as src_fd, open(dst, 'wb') as dst_fd:
+        fcntl.ioctl(dst_fd.fileno(), FICLONE, src_fd.fileno())
+
+
+def copy_range(src, dst):
+    with open(src, 'rb') as src_fd, open(dst, 'wb') as dst_fd:
+        size = os.fstat(src_fd.fileno()).st_size
+        while size > 0:
+            copied = os.copy_file_range(src_fd.fileno(), dst_fd.fileno(), size)
+            if copied == 0:
+                break
+            size -= copied
+
+
+def clone_file(src, dst):
+    """
+    Copy src to dst as cheaply as the filesystem allows.
+
+    Tries a reflink first, then a hardlink for read-only files (they can
+    not be changed through the link), then copy_file_range and finally a
+    plain copy. Returns the method that worked.
+    """
+    try:
+        reflink(src, dst)
+        method = 'reflink'
+    except (ImportError, OSError):
+        method = None
+
+    if method is None and is_read_only(src):
+        if os.path.exists(dst):
+            os.unlink(dst)
+        try:
+            os.link(src, dst)
+            return 'hardlink'
+        except OSError:
+            pass
+
+    if method is None and hasattr(os, 'copy_file_range'):
+        try:
+            copy_range(src, dst)
+            method = 'copy_file_range'
+        except OSError:
+            method = None
+
+    if method is None:
+        shutil.copyfile(src, dst)
+        method = 'copy'
+    shutil.copymode(src, dst)
+    return method
+
+
+class Materializer():
+    """
+    Writes a generated project, keeping the hash of every file it wrote in
+    a manifest inside the project.
+
+    Running it again against an existing project only rewrites the files
+    whose content changed since the last generation, and removes the files
+    of the last generation this one did not produce (deleted from the
+    skeleton), unless they were edited since.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+        self.manifest = self.load()
+        self.written = []
+        self.skipped = []
+        self.removed = []
+
+    @property
+    def manifest_file(self):
+        return os.path.join(self.root, MANIFEST_FILE)
+
+    def load(self):
+        try:
+            with open(self.manifest_file) as fd:
+                return json.load(fd).get('files', {})
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        # Every file of this generation is recorded by now
+        stale = self.prune()
+        with self.lock:
+            if not self.written and not stale and os.path.exists(self.manifest_file):
+                return
+            data = json.dumps({'files': self.manifest}, indent=2, sort_keys=True)
+        self.write_atomic(self.manifest_file, data.encode('utf-8'))
+
+    def prune(self):
+        """
+        Forget the files of the manifest that were neither written nor
+        skipped, and delete those still as they were written.
+        Returns the forgotten paths.
+        """
+        with self.lock:
+            produced = set(self.relpath(path) for path in self.written + self.skipped)
+            stale = dict((relpath, digest) for relpath, digest in self.manifest.items() if relpath not in produced)
+            for relpath in stale:
+                del self.manifest[relpath]
+        for relpath, digest in sorted(stale.items()):
+            path = os.path.join(self.root, relpath)
+            if not os.path.isfile(path) or file_hash(path) != digest:
+                continue
+            os.unlink(path)
+            self.removed.append(path)
+            self.remove_empty_dirs(os.path.dirname(path))
+        return list(stale)
+
+    def remove_empty_dirs(self, path):
+        root = os.path.abspath(self.root)
+        path = os.path.abspath(path)
+        while path.startswith(root + os.sep):
+            try:
+                os.rmdir(path)
+            except OSError:
+                return
+            path = os.path.dirname(path)
+
+    def relpath(self, path):
+        return os.path.relpath(path, self.root)
+
+    def is_current(self, path, digest):
+        with self.lock:
+            return self.manifest.get(self.relpath(path)) == digest and os.path.exists(path)
+
+    def record(self, path, digest, written):
+        with self.lock:
+            self.manifest[self.relpath(path)] = digest
+            (self.written if written else self.skipped).append(path)
+
+    def write_atomic(self, path, data, mode=None):
+        # A new inode each time, so a hardlinked file is never changed in place
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = "{}.tmp-{}-{}".format(path, os.getpid(), threading.get_ident())
+        with open(tmp_path, 'wb') as fd:
+            fd.write(data)
+        if mode is not None:
+            os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+        recorder.add_bytes(len(data))
+
+    def write(self, path, content, mode=None):
+        data = content.encode('utf-8') if isinstance(content, str) else content
+        digest = content_hash(data)
+        if self.is_current(path, digest):
+            self.record(path, digest, False)
+            return False
+        self.write_atomic(path, data, mode)
+        self.record(path, digest, True)
+        return True
+
+    def copy(self, src, dst):
+        digest = file_hash(src)
+        if self.is_current(dst, digest):
+            self.record(dst, digest, False)
+            return False
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        if os.path.lexists(dst):
+            os.unlink(dst)
+        if clone_file(src, dst) != 'hardlink':
+            recorder.add_bytes(os.path.getsize(dst))
+        self.record(dst, digest, True)
+        return True
+
+    def copy_tree(self, source):
+        for dirpath, dirnames, filenames in os.walk(source):
+            dirnames[:] = [dirname for dirname in dirnames if dirname != '__pycache__']
+            target_dir = os.path.join(self.root, os.path.relpath(dirpath, source))
+            os.makedirs(target_dir, exist_ok=True)
+            for filename in filenames:
+                self.copy(os.path.join(dirpath, filename), os.path.join(target_dir, filename))
+
+
+class MemoryTree():
+    """
+    In-memory stand-in for a Materializer.
+
+    The project steps render into it without touching the filesystem, then
+    the tree is either flushed to a directory in one pass or streamed out
+    as a tar.gz or zip archive.
+    """
+
+    ARCHIVE_FORMATS = ('tar.gz', 'zip')
+
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+        self.files = {}
+        self.written = []
+        self.skipped = []
+
+    def relpath(self, path):
+        return os.path.relpath(path, self.root)
+
+    def write(self, path, content, mode=0o644):
+        data = content.encode('utf-8') if isinstance(content, str) else content
+        with self.lock:
+            self.files[self.relpath(path)] = (data, mode)
+            self.written.append(path)
+        return True
+
+    def copy(self, src, dst):
+        with open(src, 'rb') as fd:
+            data = fd.read()
+        return self.write(dst, data, stat.S_IMODE(os.stat(src).st_mode))
+
+    def copy_tree(self, source):
+        for dirpath, dirnames, filenames in os.walk(source):
+            dirnames[:] = [dirname for dirname in dirnames if dirname != '__pycache__']
+            target_dir = os.path.join(self.root, os.path.relpath(dirpath, source))
+            for filename in filenames:
+                self.copy(os.path.join(dirpath, filename), os.path.join(target_dir, filename))
+
+    def save(self):
+        # The manifest is written by the Materializer the tree is flushed to
+        pass
+
+    def flush(self, root=None):
+        files = Materializer(root or self.root)
+        for relpath, (data, mode) in sorted(self.files.items()):
+            files.write(os.path.join(files.root, relpath), data, mode)
+        files.save()
+        return files
+
+    def write_archive(self, fileobj, fmt='tar.gz', prefix=None):
+        """
+        Stream the tree to fileobj, which does not need to be seekable
+        (stdout, a socket, an upload stream...). Entries are stored under
+        prefix, the project directory name by default.
+        """
+        prefix = os.path.basename(self.root) if prefix is None else prefix
+        mtime = time.time()
+        items = sorted(self.files.items())
+        if fmt == 'tar.gz':
+            with tarfile.open(fileobj=fileobj, mode='w|gz') as archive:
+                for relpath, (data, mode) in items:
+                    info = tarfile.TarInfo(os.path.join(prefix, relpath))
+                    info.size = len(data)
+                    info.mode = mode
+                    info.mtime = mtime
+                    archive.addfile(info, io.BytesIO(data))
+        elif fmt == 'zip':
+            with zipfile.ZipFile(fileobj, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+                for relpath, (data, mode) in items:
+                    info = zipfile.ZipInfo(os.path.join(prefix, relpath), time.localtime(mtime)[:6])
+                    info.external_attr = (stat.S_IFREG | mode) << 16
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                    archive.writestr(info, data)
+        else:
+            raise ValueError("Unknown archive format {!r}, use one of {}.".format(fmt, ", ".join(self.ARCHIVE_FORMATS)))
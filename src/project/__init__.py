@@ -1,13 +1,14 @@
 import os
-import shutil
-import jinja2
 
 
 import config
 
 
+import external
 from external import Git
-from template import next_step, global_vars
+from materialize import Materializer, MemoryTree
+from scheduler import Scheduler
+from template import next_step, get_environment, render
 
 
 # Environment variables
@@ -73,15 +74,11 @@ class Project():
 
     @classmethod
     def get_template(cls, filename):
-        template_loader = jinja2.FileSystemLoader(searchpath=cls.tpl_path())
-        template_env = jinja2.Environment(loader=template_loader)
-        return template_env.get_template(filename)
+        return get_environment(cls.tpl_path()).get_template(filename)
 
     @classmethod
-    def generate(cls, template_file, template_vars=dict()):
-        template = cls.get_template(template_file)
-        template_vars.update(global_vars)
-        return template.render(template_vars)
+    def generate(cls, template_file, template_vars=None):
+        return render(cls.get_template(template_file), template_vars)
 
     @classmethod
     def generate_config(cls, config):
@@ -99,33 +96,65 @@ class Project():
     def gitignore_file(self):
         return os.path.join(self.app_path, '.gitignore')
 
-    def install(self):
-        self.copy_skeleton()
-        self.create_config()
-        self.create_version()
-        self.create_readme()
+    def uses_external_tools(self):
+        return bool(self.git)
 
+    def render_steps(self, scheduler):
+        # Steps that only produce files through self.files.
+        # Everything lives inside the copied skeleton, so it goes first
+        skeleton = scheduler.add('skeleton', self.copy_skeleton)
+        scheduler.add('config', self.create_config, requires=[skeleton])
+        scheduler.add('version', self.create_version, requires=[skeleton])
+        scheduler.add('readme', self.create_readme, requires=[skeleton])
         if self.git:
-            Git.install(self.app_path, self.gitignore_template, self.gitignore_file)
+            scheduler.add('gitignore', self.create_gitignore, requires=[skeleton])
+
+    def install_steps(self, scheduler):
+        self.render_steps(scheduler)
+        if self.git:
+            scheduler.add('git', Git.install_git, self.app_path, requires=['skeleton'])
+
+    def run_steps(self, files, steps, workers=None):
+        self.files = files
+        external.cancelled.clear()
+        scheduler = Scheduler(workers, on_error=external.cancel)
+        steps(scheduler)
+        scheduler.add('manifest', self.files.save, requires=list(scheduler.steps))
+        scheduler.run()
+        return files
+
+    def install(self, workers=None):
+        # Works on a new or an already generated path, only changed files are written
+        return self.run_steps(Materializer(self.app_path), self.install_steps, workers)
+
+    def render(self, workers=None):
+        """
+        Render the project files into a MemoryTree without touching the disk.
+
+        Git, virtualenv and bower need a real directory, so they can not be
+        part of an in-memory project.
+        """
+        if self.uses_external_tools():
+            raise ValueError("Git, virtualenv and bower need the project on disk, use install() instead.")
+        return self.run_steps(MemoryTree(self.app_path), self.render_steps, workers)
 
     @next_step("Copying Skeleton...\t\t")
     def copy_skeleton(self):
-        # Copying the whole skeleton into the new path. Error if the path already exists
-        # TODO error handling here.
-        shutil.copytree(self.source_path, self.app_path)
+        self.files.copy_tree(self.source_path)
 
     @next_step("Creating config file...\t\t")
     def create_config(self):
         # Creating the configuration file using the command line arguments
-        with open(self.project_config_file, 'w') as fd:
-            fd.write(self.generate_config(self.config))
+        self.files.write(self.project_config_file, self.generate_config(self.config))
 
     @next_step("Setting version file...\t\t")
     def create_version(self):
-        with open(self.version_file, 'w') as fd:
-            fd.write(self.version)
+        self.files.write(self.version_file, self.version)
 
     @next_step("Creating readme file...\t\t")
     def create_readme(self):
-        with open(self.project_readme_file, 'w') as fd:
-            fd.write(self.generate_readme(self.config))
+        self.files.write(self.project_readme_file, self.generate_readme(self.config))
+
+    @next_step("Generating Gitignore...\t\t")
+    def create_gitignore(self):
+        self.files.copy(self.gitignore_template, self.gitignore_file)
@@ -1,28 +1,45 @@
 import os
+import re
+import sys
 import codecs
 
+import config
+import external
 from external import Virtualenv, Bower
-from template import template_env, next_step
+from template import next_step
 from .python import PythonProject
 
 
 class FlaskProject(PythonProject):
-    template_name = "flask"
+    template_name = "skel"
     npm_file = "package.jinja2"
 
     def __init__(self, appname="app", **kwargs):
         PythonProject.__init__(self, appname, **kwargs)
 
-        self.secret_key = codecs.encode(os.urandom(32), 'hex').decode('utf-8')
+        self.secret_key = kwargs.get('secret_key') or self.existing_secret_key() or self.new_secret_key()
         self.bower = kwargs.get('bower', [])
 
+    @staticmethod
+    def new_secret_key():
+        return codecs.encode(os.urandom(32), 'hex').decode('utf-8')
+
+    def existing_secret_key(self):
+        # Keep the key of an already generated project, so its config is not rewritten
+        try:
+            with open(self.project_config_file) as fd:
+                match = re.search(r"^SECRET_KEY = '([0-9a-f]+)'$", fd.read(), re.MULTILINE)
+        except OSError:
+            return None
+        return match.group(1) if match else None
+
     @property
     def project_npm_file(self):
         return os.path.join(self.app_path, 'package.json')
 
     @property
     def config_template(self):
-        return template_env.get_template(self.config_file)
+        return self.get_template(self.config_file)
 
     @property
     def config(self):
@@ -57,24 +74,114 @@ class FlaskProject(PythonProject):
 
     @property
     def static_dir(self):
-        return self.app_path
+        return os.path.join(self.app_path, 'app', 'static')
 
     @property
     def project_config_file(self):
         return os.path.join(self.app_path, 'config.py')
 
-    def install(self):
-        PythonProject.install(self)
-        self.create_npm()
+    def uses_external_tools(self):
+        return PythonProject.uses_external_tools(self) or bool(self.bower)
+
+    def render_steps(self, scheduler):
+        PythonProject.render_steps(self, scheduler)
+        scheduler.add('npm', self.create_npm, requires=['skeleton'])
+
+    def install_steps(self, scheduler):
+        PythonProject.install_steps(self, scheduler)
         if self.bower:
-            Bower.install(self.static_dir, self.bower)
+            bower_step = scheduler.add('bower', Bower.install, self.static_dir, self.bower, requires=['skeleton'])
+            scheduler.add('assets', self.build_assets, requires=[bower_step])
 
     @next_step("Creating npm package file...\t\t")
     def create_npm(self):
-        with open(self.project_npm_file, 'w') as fd:
-            fd.write(self.generate(self.npm_file, self.config))
+        self.files.write(self.project_npm_file, self.generate(self.npm_file, self.config))
+
+    @next_step("Building static assets...\t\t")
+    def build_assets(self):
+        # build_assets.py of the skeleton only needs the standard library
+        external.run(
+            [sys.executable, 'build_assets.py'],
+            config.LOG_ASSETS,
+            "An error occured while building the static assets.",
+            False,
+            cwd=self.app_path,
+            timeout=config.TIMEOUT_ASSETS
+        )
 
 
 class FlaskDbProject(FlaskProject):
     template_name = "skel_db"
     database = True
+
+    # SQLite pragmas applied to every connection, and the connection pool
+    db_profiles = {
+        'dev': {
+            'pragmas': [
+                ('journal_mode', 'WAL'),
+                ('synchronous', 'NORMAL'),
+                ('busy_timeout', 5000),
+                ('foreign_keys', 'ON'),
+            ],
+            'pool': {'size': 5, 'max_overflow': 10, 'recycle': 3600},
+        },
+        'read-heavy': {
+            'pragmas': [
+                ('journal_mode', 'WAL'),
+                ('synchronous', 'NORMAL'),
+                ('busy_timeout', 5000),
+                ('foreign_keys', 'ON'),
+                ('cache_size', -64000),
+                ('mmap_size', 268435456),
+                ('temp_store', 'MEMORY'),
+            ],
+            'pool': {'size': 10, 'max_overflow': 20, 'recycle': 3600},
+        },
+        'write-heavy': {
+            'pragmas': [
+                ('journal_mode', 'WAL'),
+                ('synchronous', 'NORMAL'),
+                ('busy_timeout', 30000),
+                ('foreign_keys', 'ON'),
+                ('cache_size', -32000),
+                ('mmap_size', 134217728),
+                ('temp_store', 'MEMORY'),
+                ('wal_autocheckpoint', 10000),
+            ],
+            # SQLite has a single writer, more connections only wait longer
+            'pool': {'size': 5, 'max_overflow': 5, 'recycle': 1800},
+        },
+    }
+
+    def __init__(self, appname="app", **kwargs):
+        FlaskProject.__init__(self, appname, **kwargs)
+        self.db_profile = kwargs.get('db_profile', 'dev')
+
+    @property
+    def config(self):
+        config = FlaskProject.config.fget(self)
+        profile = self.db_profiles[self.db_profile]
+        config.update({
+            'db_profile': self.db_profile,
+            'db_pragmas': profile['pragmas'],
+            'db_pool': profile['pool'],
+        })
+        return config
+
+    @property
+    def brief_var(self):
+        brief_var = FlaskProject.brief_var.fget(self)
+        brief_var['db_profile'] = self.db_profile
+        return brief_var
+
+
+class FlaskAsyncProject(FlaskDbProject):
+    # Async views (Quart) served over ASGI, with an async database session
+    template_name = "skel_async"
+    asynchronous = True
+
+    @property
+    def brief_var(self):
+        brief_var = FlaskDbProject.brief_var.fget(self)
+        brief_var['asynchronous'] = self.asynchronous
+        return brief_var
@@ -12,6 +12,7 @@ class PythonProject(Project):
     def __init__(self, appname="app", **kwargs):
         Project.__init__(self, appname, **kwargs)
         self.virtualenv = kwargs.get('virtualenv', False)
+        self.venv_cache = kwargs.get('venv_cache', True)
 
     @property
     def project_setup_file(self):
@@ -37,13 +38,42 @@ class PythonProject(Project):
     def requirements_file(self):
         return os.path.join(self.app_path, 'requirements.txt')
 
-    def install(self):
-        Project.install(self)
-        self.create_setup()
-        if self.virtualenv:
-            Virtualenv.install(self.venv_dir, self.requirements_file)
+    @property
+    def skeleton_requirements_file(self):
+        return os.path.join(self.source_path, 'requirements.txt')
+
+    def uses_external_tools(self):
+        return Project.uses_external_tools(self) or bool(self.virtualenv)
+
+    def render_steps(self, scheduler):
+        Project.render_steps(self, scheduler)
+        scheduler.add('setup', self.create_setup, requires=['skeleton'])
+
+    def install_steps(self, scheduler):
+        Project.install_steps(self, scheduler)
+        if not self.virtualenv:
+            return
+        if self.venv_cache:
+            # The cached environment only depends on the skeleton, not on the copy
+            scheduler.add('virtualenv-cache', Virtualenv.prepare, self.skeleton_requirements_file)
+            scheduler.add(
+                'virtualenv',
+                self.clone_venv,
+                requires=['skeleton', 'virtualenv-cache']
+            )
+        else:
+            venv = scheduler.add('virtualenv', Virtualenv.install_venv, self.venv_dir, requires=['skeleton'])
+            scheduler.add(
+                'pip',
+                Virtualenv.install_dependencies,
+                self.venv_dir,
+                self.requirements_file,
+                requires=['skeleton', venv]
+            )
+
+    def clone_venv(self):
+        Virtualenv.clone(Virtualenv.prepare(self.skeleton_requirements_file), self.venv_dir)
 
     @next_step("Creating setup file...\t\t")
     def create_setup(self):
-        with open(self.project_setup_file, 'w') as fd:
-            fd.write(self.generate(self.setup_file, self.config))
+        self.files.write(self.project_setup_file, self.generate(self.setup_file, self.config))
@@ -1,28 +1,72 @@
 #! /usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import time
+started = time.perf_counter()
+
 import sys
 import argparse
+import contextlib
 
-from utils import query_yes_no
-from external import External
-from project.flask import FlaskProject, FlaskDbProject
-from template import generate_brief, generate_errorlist
+import instrumentation
 
 
 def generate_crsf_secret_key():
     return
 
 
+def print_timings(timings):
+    # On stderr, so the brief can still be piped
+    previous = started
+    for name, moment in timings:
+        print("{:<16}{:>8.1f}ms".format(name, (moment - previous) * 1e3), file=sys.stderr)
+        previous = moment
+    print("{:<16}{:>8.1f}ms".format("Startup", (previous - started) * 1e3), file=sys.stderr)
+
+
+def write_archive(project, filename, fmt=None, stdout=None):
+    if fmt is None:
+        fmt = 'zip' if filename.endswith('.zip') else 'tar.gz'
+    files = project.render()
+    if filename == '-':
+        files.write_archive(stdout, fmt)
+        stdout.flush()
+    else:
+        with open(filename, 'wb') as fd:
+            files.write_archive(fd, fmt)
+
+
 def main(argv):
     parser = argparse.ArgumentParser(description='Create a skeleton application using some command line options.')
     parser.add_argument('appname', help='The application name')
     parser.add_argument('-b', '--bower', help='Dependencies installed using bower')
     parser.add_argument('-n', '--no-debug', action='store_false')
     parser.add_argument('-v', '--virtualenv', action='store_true')
+    parser.add_argument('--no-venv-cache', dest='venv_cache', action='store_false',
+                        help='Always build the virtualenv from scratch instead of cloning a cached one')
     parser.add_argument('-d', '--database', action='store_true')
+    parser.add_argument('--db-profile', choices=['dev', 'read-heavy', 'write-heavy'], default='dev',
+                        help='SQLite pragmas and connection pool of the generated database config')
+    parser.add_argument('--async', dest='asynchronous', action='store_true',
+                        help='Async views served over ASGI, with an async database session (implies --database)')
     parser.add_argument('-g', '--git', action='store_true')
+    parser.add_argument('--trace', metavar='FILE', help='Write the timings of every step to FILE')
+    parser.add_argument('--trace-format', choices=sorted(instrumentation.TRACE_FORMATS), default='chrome',
+                        help='Chrome trace_event format (chrome://tracing, Perfetto) or plain JSON')
+    parser.add_argument('--timings', action='store_true', help='Report the startup time up to the brief')
+    parser.add_argument('--archive', metavar='FILE',
+                        help='Render the project in memory and write it as an archive to FILE ("-" for stdout)')
+    parser.add_argument('--archive-format', choices=['tar.gz', 'zip'],
+                        help='Archive format, guessed from FILE by default')
     args = parser.parse_args()
+    timings = [("Arguments", time.perf_counter())]
+
+    # Imported once the arguments are known, so --help does not pay for them
+    from utils import query_yes_no
+    from external import External
+    from project.flask import FlaskProject, FlaskDbProject, FlaskAsyncProject
+    from template import generate_brief, generate_errorlist
+    timings.append(("Imports", time.perf_counter()))
 
     bower = None
     if args.bower:
@@ -33,8 +77,10 @@ def main(argv):
     database = args.database
     git = args.git
 
-    if database:
-        project = FlaskDbProject(appname)
+    if args.asynchronous:
+        project = FlaskAsyncProject(appname, db_profile=args.db_profile)
+    elif database:
+        project = FlaskDbProject(appname, db_profile=args.db_profile)
     else:
         project = FlaskProject(appname)
 
@@ -42,16 +88,40 @@ def main(argv):
 
     project.bower = bower
     project.virtualenv = virtualenv
+    project.venv_cache = args.venv_cache
     project.git = git
 
-    print(generate_brief(project.brief_var))
+    if args.archive:
+        if project.uses_external_tools():
+            parser.error("--archive can not be combined with --git, --virtualenv or --bower")
+        # Nothing is written to disk, so there is nothing to confirm.
+        # The progress goes to stderr, stdout may be the archive itself
+        stdout = sys.stdout.buffer
+        with contextlib.redirect_stdout(sys.stderr):
+            print(generate_brief(project.brief_var))
+            if args.timings:
+                print_timings(timings)
+            write_archive(project, args.archive, args.archive_format, stdout)
+        return
+
+    brief_var = project.brief_var
+    timings.append(("Tool discovery", time.perf_counter()))
+    print(generate_brief(brief_var))
+    timings.append(("Brief", time.perf_counter()))
+    if args.timings:
+        print_timings(timings)
+
     errors = External().errors
     if len(errors) > 0:
         print(generate_errorlist({'errors': errors, }))
         sys.exit(1)
 
     if query_yes_no("Is this correct ?"):
-        project.install()
+        try:
+            project.install()
+        finally:
+            if args.trace:
+                instrumentation.export(args.trace, instrumentation.recorder.as_dicts(), args.trace_format)
     else:
         print("Aborting")
         sys.exit(0)
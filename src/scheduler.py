@@ -0,0 +1,99 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class SchedulerError(Exception):
+    pass
+
+
+class Step():
+    def __init__(self, name, func, args=(), kwargs=None, requires=()):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.requires = tuple(requires)
+
+    def __call__(self):
+        return self.func(*self.args, **self.kwargs)
+
+    def __repr__(self):
+        return "Step({!r}, requires={!r})".format(self.name, self.requires)
+
+
+class Scheduler():
+    """
+    Runs a small dependency graph of install steps on a thread pool.
+
+    Each step starts as soon as every step it requires has finished, so
+    independent steps (git init, virtualenv, bower install, rendered files)
+    overlap and the total time is the length of the longest chain.
+    """
+
+    def __init__(self, workers=None, on_error=None):
+        self.workers = workers or min(32, (os.cpu_count() or 1) + 4)
+        self.on_error = on_error
+        self.steps = {}
+
+    def add(self, name, func, *args, requires=(), **kwargs):
+        if name in self.steps:
+            raise SchedulerError("Step {!r} is already scheduled.".format(name))
+        self.steps[name] = Step(name, func, args, kwargs, requires)
+        return name
+
+    def check(self):
+        for step in self.steps.values():
+            for required in step.requires:
+                if required not in self.steps:
+                    raise SchedulerError("Step {!r} requires unknown step {!r}.".format(step.name, required))
+
+        # Kahn's algorithm, only to detect cycles before anything runs
+        pending = {name: set(step.requires) for name, step in self.steps.items()}
+        while pending:
+            ready = [name for name, requires in pending.items() if not requires]
+            if not ready:
+                raise SchedulerError("Steps {!r} depend on each other.".format(sorted(pending)))
+            for name in ready:
+                del pending[name]
+            for requires in pending.values():
+                requires.difference_update(ready)
+
+    def run(self):
+        """
+        Run every step, respecting dependencies.
+
+        When a step fails no new steps are started, on_error is called so the
+        running ones can be cut short, and the first error is raised again.
+        """
+        self.check()
+        done = set()
+        waiting = dict(self.steps)
+        running = {}
+        error = None
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while waiting or running:
+                if error is None:
+                    for name, step in list(waiting.items()):
+                        if done.issuperset(step.requires):
+                            del waiting[name]
+                            running[executor.submit(step)] = name
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        future.result()
+                    except BaseException as e:
+                        if error is None:
+                            error = e
+                            if self.on_error is not None:
+                                self.on_error()
+                    else:
+                        done.add(name)
+
+        if error is not None:
+            raise error
+        return done
@@ -1,14 +1,45 @@
-import jinja2
+import os
+import inspect
 import platform
+import threading
 
 import config
 
 from utils import colors
+from instrumentation import recorder
 
 
-# Jinja2 Environment
-template_loader = jinja2.FileSystemLoader(searchpath=config.TEMPLATE_DIR)
-template_env = jinja2.Environment(loader=template_loader)
+def get_bytecode_cache(directory=config.TEMPLATE_CACHE_DIR):
+    import jinja2
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError:
+        # Compile in memory only when the cache directory is not writable
+        return None
+    return jinja2.FileSystemBytecodeCache(directory)
+
+
+# One Jinja2 Environment per template directory, kept for the whole process.
+# Jinja2 is only imported with the first environment, it is most of the startup time.
+environments = {}
+environments_lock = threading.Lock()
+bytecode_cache = None
+
+
+def get_environment(searchpath):
+    global bytecode_cache
+    with environments_lock:
+        env = environments.get(searchpath)
+        if env is None:
+            import jinja2
+            if bytecode_cache is None:
+                bytecode_cache = get_bytecode_cache()
+            env = jinja2.Environment(
+                loader=jinja2.FileSystemLoader(searchpath=searchpath),
+                bytecode_cache=bytecode_cache
+            )
+            environments[searchpath] = env
+    return env
 
 
 global_vars = {
@@ -21,20 +52,53 @@ global_vars = {
 }
 
 
+# Steps may run concurrently, each progress line is printed whole
+output_lock = threading.Lock()
+
+
 def next_step(msg="Next step"):
+    """
+    Progress and instrumentation decorator for an install step.
+
+    The message may use the step arguments as format fields, e.g.
+    "Installing {package}...". The line is printed once the step is over,
+    so the output stays readable when several steps overlap. The timings of
+    the step are kept by instrumentation.recorder.
+    """
     def next_step_decorator(f):
+        signature = inspect.signature(f)
+
         def decorated(*args, **kwargs):
-            print("{msg}\t".format(msg=msg), end="", flush=True)
-            f(*args, **kwargs)
-            print("{green}Ok{end}".format(green=colors.OKGREEN, end=colors.ENDC))
+            arguments = signature.bind(*args, **kwargs).arguments
+            title = msg.format(**arguments)
+            try:
+                with recorder.step(title.strip().rstrip('.')) as record:
+                    result = f(*args, **kwargs)
+            except BaseException:
+                with output_lock:
+                    print("{title}\t{red}Failed{end}".format(title=title, red=colors.FAIL, end=colors.ENDC), flush=True)
+                raise
+            with output_lock:
+                print("{title}\t{green}Ok{end} ({wall:.2f}s)".format(
+                    title=title,
+                    wall=record.wall,
+                    green=colors.OKGREEN,
+                    end=colors.ENDC
+                ), flush=True)
+            return result
         return decorated
     return next_step_decorator
 
 
-def generate(template_file='', template_vars=dict()):
-    template = template_env.get_template(template_file)
-    template_vars.update(global_vars)
-    return template.render(template_vars)
+def render(template, template_vars=None):
+    # Never touch the caller's dict, the same context may be rendered from several threads
+    context = dict(template_vars or {})
+    context.update(global_vars)
+    return template.render(context)
+
+
+def generate(template_file='', template_vars=None):
+    return render(get_environment(config.TEMPLATE_DIR).get_template(template_file), template_vars)
 
 
 def generate_brief(template_var):